@@ -12,5 +12,10 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Website.settings')
+# Sync code runs on short-lived executor threads under ASGI, and persistent
+# connections would be left open on each of them. On Postgres use DB_POOL.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+# route the catalog, cart and API views to their async twins (devloom.urls)
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
@@ -2,6 +2,7 @@
 # --- Imports and environment loading ---
 import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 BASE_DIR = Path(__file__).resolve().parent.parent
 load_dotenv(BASE_DIR / '.env')
@@ -46,12 +47,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so its timings cover the rest of the stack
+    'devloom.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'devloom.cart.CartMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -64,13 +68,108 @@ WSGI_APPLICATION = 'Website.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# DB_ENGINE=sqlite (default) or postgres. SQLite runs in WAL mode, so pages keep
+# reading while a checkout writes; `manage.py bench_db_concurrency` measures it.
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+# seconds a connection is reused across requests (0 = one per request);
+# Website/asgi.py defaults it to 0, as Django advises under ASGI
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+
+if DB_ENGINE == 'postgres':
+    # psycopg's pool (pip install "psycopg[pool]") replaces persistent connections
+    DB_POOL = os.getenv('DB_POOL', 'False') == 'True'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'ecomclean'),
+            'USER': os.getenv('DB_USER', ''),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', ''),
+            'PORT': os.getenv('DB_PORT', ''),
+            'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                    'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+                },
+            } if DB_POOL else {},
+        }
+    }
+elif DB_ENGINE == 'sqlite':
+    # "delete" restores SQLite's default rollback journal, e.g. to compare in benchmarks
+    DB_SQLITE_JOURNAL_MODE = os.getenv('DB_SQLITE_JOURNAL_MODE', 'wal')
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # seconds to wait for a lock (busy_timeout) before "database is locked"
+                'timeout': float(os.getenv('DB_BUSY_TIMEOUT', 20)),
+                # take the write lock at BEGIN: a transaction that reads then writes
+                # waits its turn instead of failing when it tries to upgrade its lock
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': ';'.join([
+                    f'PRAGMA journal_mode={DB_SQLITE_JOURNAL_MODE}',
+                    # with WAL, fsync at checkpoints only; still crash-safe
+                    'PRAGMA synchronous=NORMAL',
+                    'PRAGMA temp_store=MEMORY',
+                    'PRAGMA cache_size=-32000',  # KiB, per connection
+                    'PRAGMA mmap_size=134217728',
+                ]),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"DB_ENGINE must be 'sqlite' or 'postgres', not {DB_ENGINE!r}")
+
+
+# Cache
+# Local memory is per process: invalidations made by one worker or management
+# command never reach the others. Outside DEBUG the default is therefore the
+# file cache, which all processes on the host share.
 
-DATABASES = {
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem' if DEBUG else 'file')
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+}
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    raise ImproperlyConfigured(f"CACHE_BACKEND must be 'locmem' or 'file', not {CACHE_BACKEND!r}")
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / 'cache') if CACHE_BACKEND == 'file' else 'devloom'),
     }
 }
+# seconds a cache tag version lives (0 = until bumped). With a per-process
+# cache this bounds how long another process's change can go unseen.
+DEVLOOM_CACHE_TAG_TIMEOUT = int(os.getenv('CACHE_TAG_TIMEOUT', 300 if CACHE_BACKEND == 'locmem' else 0)) or None
+DEVLOOM_PAGE_CACHE_TIMEOUT = int(os.getenv('PAGE_CACHE_TIMEOUT', 60 * 60 * 24))
+
+
+# Request metrics (devloom.metrics)
+# Histograms per view at /metrics, for scrapers sending
+# "Authorization: Bearer $METRICS_TOKEN" (unset: the endpoint is off). A
+# sampled fraction of requests (0 to 1) also times queries and templates.
+# Requests slower than SLOW_REQUEST_MS are logged, with their slowest SQL
+# when sampled.
+
+DEVLOOM_METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+DEVLOOM_METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 0))
+DEVLOOM_SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 1000))
+
+
+# Async views (devloom.urls)
+# Serve the product list, product detail, cart and /api/v1/ views from their
+# async def twins. Website/asgi.py turns this on; under WSGI each async view
+# would only run through an event loop per request.
+
+DEVLOOM_ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
 
 
 # Password validation
@@ -108,6 +207,18 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# `collectstatic` writes content-hashed copies plus a manifest; templates using
+# {% static %} then emit URLs that are safe to cache forever.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'devloom.storage.VersionedStaticFilesStorage',
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -117,7 +228,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # the stock backend, plus render timing for devloom.metrics
+        'BACKEND': 'devloom.metrics.DjangoTemplates',
         'DIRS': [
             BASE_DIR / 'templates',
             BASE_DIR / 'devloom' / 'templates',
@@ -131,6 +243,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'devloom.context_processors.static_version',
                 'devloom.context_processors.cart_count',
+                'devloom.context_processors.page_cache_holes',
             ],
         },
     },
@@ -0,0 +1,242 @@
+"""JSON endpoints: the storefront's typeahead and the read-only catalog API.
+
+The ``/api/v1/`` views are wrapped in Django's ``condition`` decorator with
+an ETag made from the catalog version (devloom.cache.catalog_version) and
+the request URL, and a Last-Modified from the last catalog change. Both are
+read from the cache, so a client polling with ``If-None-Match`` gets a 304
+without the view running or any row being queried.
+
+Each ``/api/v1/`` view has an ``async def`` twin (``aproducts`` and so on)
+that devloom.urls routes instead when DEVLOOM_ASYNC_VIEWS is on.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.http import JsonResponse
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+
+from .cache import catalog_modified, catalog_version, product_tag
+from .models import Category, Product
+from .pagination import apaginate, paginate, parse_page_size
+from .suggest import DEFAULT_LIMIT, suggest as suggest_names
+
+# field name -> model columns it needs
+PRODUCT_FIELDS = {
+    'id': ('id',),
+    'name': ('name',),
+    'description': ('description',),
+    'price': ('price',),
+    'stock': ('stock',),
+    'category': ('category_id', 'category__name'),
+    'image': ('image',),
+    'ram_gb': ('ram_gb',),
+    'storage_gb': ('storage_gb',),
+    'created_at': ('created_at',),
+    'url': ('id',),
+}
+DEFAULT_PRODUCT_FIELDS = ('id', 'name', 'price', 'stock', 'category', 'image', 'url')
+
+
+@require_GET
+def suggest(request):
+    """Typeahead: ``/api/suggest?q=len&limit=8`` -> product names for a prefix.
+
+    Served from the in-memory index in devloom.suggest; no database query.
+    """
+    query = request.GET.get('q', '')
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    results = [{'id': pk, 'name': name, 'url': reverse('product_detail', args=[pk])}
+               for pk, name in suggest_names(query, limit)]
+    response = JsonResponse({'query': query, 'results': results})
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
+# --- /api/v1/ ---
+
+class BadRequest(Exception):
+    pass
+
+
+def _etag(request, *tags):
+    version = catalog_version(*tags)
+    return hashlib.sha1(f'{version}|{request.get_full_path()}'.encode()).hexdigest()
+
+
+def _last_modified(request, *args, **kwargs):
+    return catalog_modified()
+
+
+def catalog_endpoint(etag_tags=None):
+    """GET-only JSON view revalidated against the catalog version.
+
+    ``etag_tags(**kwargs)`` names extra cache tags (e.g. one product's) the
+    response depends on. Views may raise BadRequest for a 400, and may be
+    ``async def``; the validators only read the cache either way.
+    """
+    def etag(request, *args, **kwargs):
+        return _etag(request, *(etag_tags(**kwargs) if etag_tags else ()))
+
+    def finish(response):
+        # let clients and proxies keep the body but always revalidate
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                try:
+                    return finish(await view(request, *args, **kwargs))
+                except BadRequest as exc:
+                    return JsonResponse({'error': str(exc)}, status=400)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                try:
+                    return finish(view(request, *args, **kwargs))
+                except BadRequest as exc:
+                    return JsonResponse({'error': str(exc)}, status=400)
+        return require_GET(condition(etag_func=etag, last_modified_func=_last_modified)(wrapper))
+    return decorator
+
+
+def _fields(request, allowed, default):
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(default)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = sorted(set(fields) - set(allowed))
+    if unknown:
+        raise BadRequest(f"unknown field(s): {', '.join(unknown)}; choose from {', '.join(allowed)}")
+    return list(dict.fromkeys(fields))
+
+
+def _product_queryset(fields):
+    columns = {'id', 'created_at'}  # the keyset cursor needs both
+    for field in fields:
+        columns.update(PRODUCT_FIELDS[field])
+    products = Product.objects.all()
+    if 'category' in fields:
+        products = products.select_related('category')
+    return products.only(*columns)
+
+
+def _product_json(request, product, fields):
+    data = {}
+    for field in fields:
+        if field == 'price':
+            data['price'] = str(product.price)
+        elif field == 'category':
+            data['category'] = {'id': product.category_id, 'name': product.category.name}
+        elif field == 'image':
+            data['image'] = request.build_absolute_uri(static(product.image)) if product.image else None
+        elif field == 'created_at':
+            data['created_at'] = product.created_at.isoformat()
+        elif field == 'url':
+            data['url'] = request.build_absolute_uri(reverse('api_product', args=[product.pk]))
+        else:
+            data[field] = getattr(product, field)
+    return data
+
+
+def _page_url(request, cursor):
+    if not cursor:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+
+def _filtered_products(request, fields):
+    queryset = _product_queryset(fields)
+    for param, lookup in (('category', 'category_id'), ('min_ram', 'ram_gb__gte'),
+                          ('min_storage', 'storage_gb__gte')):
+        if param in request.GET:
+            try:
+                queryset = queryset.filter(**{lookup: int(request.GET[param])})
+            except ValueError:
+                raise BadRequest(f'{param} must be an integer')
+    return queryset
+
+
+def _page_response(request, page, fields):
+    return JsonResponse({
+        'results': [_product_json(request, p, fields) for p in page.object_list],
+        'next': _page_url(request, page.next_cursor),
+        'previous': _page_url(request, page.previous_cursor),
+    })
+
+
+def _category_json(listing, category):
+    return {
+        'id': category.id,
+        'name': category.name,
+        'description': category.description,
+        'product_count': category.product_count,
+        'products': f'{listing}?category={category.id}',
+    }
+
+
+@catalog_endpoint()
+def products(request):
+    """``/api/v1/products/``: newest first, keyset paginated.
+
+    Params: ``fields`` (comma separated, see PRODUCT_FIELDS), ``category``
+    (id), ``min_ram`` / ``min_storage`` (GB), ``cursor`` and ``page_size``.
+    """
+    fields = _fields(request, PRODUCT_FIELDS, DEFAULT_PRODUCT_FIELDS)
+    page = paginate(_filtered_products(request, fields), cursor=request.GET.get('cursor'),
+                    page_size=parse_page_size(request.GET.get('page_size')))
+    return _page_response(request, page, fields)
+
+
+@catalog_endpoint()
+async def aproducts(request):
+    """:func:`products` for ASGI servers, through the async ORM."""
+    fields = _fields(request, PRODUCT_FIELDS, DEFAULT_PRODUCT_FIELDS)
+    page = await apaginate(_filtered_products(request, fields), cursor=request.GET.get('cursor'),
+                           page_size=parse_page_size(request.GET.get('page_size')))
+    return _page_response(request, page, fields)
+
+
+@catalog_endpoint(lambda id: [product_tag(id)])
+def product(request, id):
+    """``/api/v1/products/<id>/``; accepts ``fields`` like the list."""
+    fields = _fields(request, PRODUCT_FIELDS, PRODUCT_FIELDS)
+    obj = _product_queryset(fields).filter(pk=id).first()
+    if obj is None:
+        return JsonResponse({'error': 'not found'}, status=404)
+    return JsonResponse(_product_json(request, obj, fields))
+
+
+@catalog_endpoint(lambda id: [product_tag(id)])
+async def aproduct(request, id):
+    """:func:`product` for ASGI servers, through the async ORM."""
+    fields = _fields(request, PRODUCT_FIELDS, PRODUCT_FIELDS)
+    obj = await _product_queryset(fields).filter(pk=id).afirst()
+    if obj is None:
+        return JsonResponse({'error': 'not found'}, status=404)
+    return JsonResponse(_product_json(request, obj, fields))
+
+
+@catalog_endpoint()
+def categories(request):
+    """``/api/v1/categories/``: every category with its product count."""
+    listing = request.build_absolute_uri(reverse('api_products'))
+    return JsonResponse({'results': [_category_json(listing, c) for c in Category.objects.order_by('name')]})
+
+
+@catalog_endpoint()
+async def acategories(request):
+    """:func:`categories` for ASGI servers, through the async ORM."""
+    listing = request.build_absolute_uri(reverse('api_products'))
+    return JsonResponse({'results': [_category_json(listing, c) async for c in Category.objects.order_by('name')]})
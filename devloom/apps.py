@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(sender, using, **kwargs):
+    """Recreate the FTS triggers that SQLite table rebuilds drop."""
+    from django.db import connections
+
+    from .search import install_index
+
+    install_index(connections[using])
 
 
 class DevloomConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'devloom'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .metrics import install_query_hook
+
+        post_migrate.connect(ensure_search_index, sender=self)
+        connection_created.connect(install_query_hook)
@@ -0,0 +1,133 @@
+"""Helpers shared by the ``bench_*`` and ``loadtest`` management commands."""
+import asyncio
+import itertools
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.db import connection
+
+
+@contextmanager
+def throwaway_database(verbosity=0):
+    """Point the default connection at a fresh, migrated scratch database.
+
+    On SQLite this is a temporary file opened with the real database's
+    OPTIONS (journal mode, pragmas, timeouts), not Django's in-memory test
+    database, which locks differently. Elsewhere it is the usual
+    ``test_<NAME>`` database. Either way it is dropped on exit.
+    """
+    tmpdir = None
+    if connection.vendor == 'sqlite':
+        tmpdir = tempfile.mkdtemp(prefix='devloom-bench-')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list (0 when empty)."""
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+# --- HTTP load generation ---
+
+class HTTPConnection:
+    """A minimal keep-alive HTTP/1.1 client on asyncio streams.
+
+    Enough to drive GETs against a local server at a steady rate without a
+    client library; bodies are read (Content-Length or chunked) and dropped.
+    """
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def get(self, path, headers=None):
+        """GET ``path``; returns ``(status, body_bytes)``."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'GET {path} HTTP/1.1', f'Host: {self.host}:{self.port}']
+        lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        try:
+            status = int((await self.reader.readline()).split()[1])
+            length, chunked, close = 0, False, False
+            while (line := await self.reader.readline()) not in (b'\r\n', b''):
+                name, _, value = line.decode('latin-1').partition(':')
+                name, value = name.strip().lower(), value.strip().lower()
+                if name == 'content-length':
+                    length = int(value)
+                elif name == 'transfer-encoding':
+                    chunked = 'chunked' in value
+                elif name == 'connection':
+                    close = value == 'close'
+            if chunked:
+                body = bytearray()
+                while size := int((await self.reader.readline()).split(b';')[0], 16):
+                    body += await self.reader.readexactly(size + 2)
+                await self.reader.readline()
+            else:
+                body = await self.reader.readexactly(length)
+        except (IndexError, ValueError, asyncio.IncompleteReadError) as exc:
+            await self.close()
+            raise ConnectionError(f'bad response to {path}') from exc
+        if close:
+            await self.close()
+        return status, bytes(body)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def http_load(base_url, paths, concurrency, seconds, bust_cache=False):
+    """Request ``paths`` round-robin from ``concurrency`` connections.
+
+    ``bust_cache`` adds a unique ``nocache`` parameter to every request, so
+    no cached page can answer. Returns ``{path: (latencies_ms, errors)}``; a
+    status of 400 or more, or a dropped connection, counts as an error.
+    """
+    url = urlsplit(base_url)
+    prefix = url.path.rstrip('/')
+    results = {path: ([], []) for path in paths}
+    deadline = time.monotonic() + seconds
+    serial = itertools.count()
+
+    async def client(offset):
+        conn = HTTPConnection(url.hostname, url.port or 80)
+        i = offset
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            timings, errors = results[path]
+            target = prefix + path
+            if bust_cache:
+                target += f'{"&" if "?" in path else "?"}nocache={next(serial)}'
+            started = time.perf_counter()
+            try:
+                status, _ = await conn.get(target)
+            except OSError as exc:
+                errors.append(f'{type(exc).__name__}: {exc}')
+                await conn.close()
+                continue
+            if status >= 400:
+                errors.append(f'HTTP {status}')
+            else:
+                timings.append((time.perf_counter() - started) * 1000)
+        await conn.close()
+
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    return results
@@ -0,0 +1,256 @@
+"""Page and fragment caching for the catalog pages.
+
+Whole pages for anonymous visitors are cached under a key that folds in the
+current version of every *tag* the page depends on: ``product:<id>`` for a
+detail page, ``list:<category>`` for a listing, and ``catalog`` for all of
+them. Saving a product or category bumps only the tags it touches (see
+devloom.signals), so exactly the affected pages miss on their next hit.
+
+Per-visitor bits of the layout -- the cart badge and the CSRF token -- are
+rendered as placeholders and filled in on every response, cached or not.
+
+Tags must live in a cache every process shares (``CACHE_BACKEND=file``, the
+default outside DEBUG) for management commands and other workers to see
+each other's invalidations. On a per-process cache, tags expire after
+DEVLOOM_CACHE_TAG_TIMEOUT so stale pages are served for that long at most.
+"""
+import hashlib
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import wraps
+from urllib.parse import quote
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+PAGE_TIMEOUT = getattr(settings, 'DEVLOOM_PAGE_CACHE_TIMEOUT', 60 * 60 * 24)
+# None keeps a tag version until it is bumped
+TAG_TIMEOUT = getattr(settings, 'DEVLOOM_CACHE_TAG_TIMEOUT', None)
+
+CART_COUNT_PLACEHOLDER = '__devloom_cart_count__'
+CSRF_TOKEN_PLACEHOLDER = '__devloom_csrf_token__'
+
+CATALOG_TAG = 'catalog'
+CARDS_TAG = 'cards'
+# moves on every product or category change; keys search results and API ETags
+PRODUCTS_TAG = 'products'
+# the typeahead index of product names (devloom.suggest)
+NAMES_TAG = 'names'
+
+
+def _tag_key(tag):
+    # category names may contain spaces; keep keys memcached-safe
+    return f'devloom:tag:{quote(tag)}'
+
+
+def tag_versions(tags):
+    """Return the current version token of each tag, creating missing ones.
+
+    A tag that was never set (or was evicted) gets a fresh random token rather
+    than a fixed default, so an eviction can never resurrect a stale page.
+    """
+    keys = [_tag_key(tag) for tag in tags]
+    found = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, TAG_TIMEOUT)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump_tags(*tags):
+    """Invalidate every cached page that depends on any of ``tags``."""
+    if tags:
+        cache.set_many({_tag_key(tag): uuid.uuid4().hex for tag in tags}, TAG_TIMEOUT)
+
+
+def list_tag(category_name=None):
+    return f'list:{category_name.lower()}' if category_name else 'list:all'
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+# --- product card fragments ---
+
+def card_generation():
+    """Version token mixed into every product card fragment key."""
+    return tag_versions([CARDS_TAG])[0]
+
+
+def card_fragment_key(product_id, generation=None):
+    if generation is None:
+        generation = card_generation()
+    return make_template_fragment_key('product_card', [product_id, generation])
+
+
+# --- invalidation ---
+
+def invalidate_products(product_ids, category_names=()):
+    """Drop the pages and cards showing the given products.
+
+    ``category_names`` are the categories the products are (or were) listed
+    under; the "all products" listing is always included.
+    """
+    product_ids = list(product_ids)
+    bump_tags(list_tag(), PRODUCTS_TAG, *(list_tag(name) for name in category_names),
+              *(product_tag(pk) for pk in product_ids))
+    _touch_catalog()
+    generation = card_generation()
+    cache.delete_many([card_fragment_key(pk, generation) for pk in product_ids])
+
+
+def invalidate_product(product, previous_category_id=None):
+    from .models import Category
+
+    category_ids = {product.category_id, previous_category_id} - {None}
+    names = Category.objects.filter(pk__in=category_ids).values_list('name', flat=True)
+    invalidate_products([product.pk], names)
+
+
+def invalidate_product_ids(product_ids):
+    """invalidate_product for rows changed by queryset.update()."""
+    from .models import Category
+
+    names = (Category.objects.filter(products__in=product_ids)
+             .values_list('name', flat=True).distinct())
+    invalidate_products(product_ids, names)
+
+
+def invalidate_category(category, previous_name=None):
+    names = {category.name, previous_name} - {None}
+    product_ids = category.products.values_list('pk', flat=True) if category.pk else []
+    invalidate_products(product_ids, names)
+
+
+def invalidate_product_names():
+    """Rebuild the typeahead index after products are added, renamed or removed."""
+    bump_tags(NAMES_TAG)
+
+
+def invalidate_catalog():
+    """Drop every cached catalog page and card (for bulk imports and the like)."""
+    bump_tags(CATALOG_TAG, CARDS_TAG, NAMES_TAG)
+    _touch_catalog()
+
+
+# --- catalog version (search cache keys, API validators) ---
+
+MODIFIED_KEY = 'devloom:catalog:modified'
+
+
+def catalog_version(*tags):
+    """Opaque token that changes whenever the catalog, or any of ``tags``, does."""
+    versions = tag_versions([CATALOG_TAG, PRODUCTS_TAG, *tags])
+    return hashlib.sha1('|'.join(versions).encode()).hexdigest()[:20]
+
+
+def catalog_modified():
+    """When the catalog last changed, as far as the cache remembers.
+
+    An evicted timestamp restarts at "now", which only costs clients one
+    full response.
+    """
+    stamp = cache.get(MODIFIED_KEY)
+    if stamp is None:
+        cache.add(MODIFIED_KEY, time.time(), TAG_TIMEOUT)
+        stamp = cache.get(MODIFIED_KEY, time.time())
+    return datetime.fromtimestamp(int(stamp), tz=timezone.utc)
+
+
+def _touch_catalog():
+    cache.set(MODIFIED_KEY, time.time(), TAG_TIMEOUT)
+
+
+# --- whole-page cache ---
+
+def _page_key(request, tags):
+    path = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+    versions = hashlib.sha1('|'.join(tag_versions(tags)).encode()).hexdigest()
+    return f'devloom:page:{path}:{versions}'
+
+
+def _fill_holes(request, html):
+    from .context_processors import cart_count
+
+    html = html.replace(CART_COUNT_PLACEHOLDER, str(cart_count(request)['cart_count']))
+    if CSRF_TOKEN_PLACEHOLDER in html:
+        html = html.replace(CSRF_TOKEN_PLACEHOLDER, get_token(request))
+    return html
+
+
+def _serve_cached(request, tags):
+    """``(key, response)``: the cached page's response, or None on a miss."""
+    key = _page_key(request, [CATALOG_TAG, *tags])
+    html = cache.get(key)
+    return key, (HttpResponse(_fill_holes(request, html)) if html is not None else None)
+
+
+def _store_page(request, key, response):
+    if response.streaming:
+        return response
+    html = response.content.decode(response.charset)
+    if response.status_code == 200 and not response.cookies:
+        cache.set(key, html, PAGE_TIMEOUT)
+    response.content = _fill_holes(request, html)
+    return response
+
+
+def cache_anonymous_page(tags_for=None):
+    """Cache a view's HTML for anonymous GETs.
+
+    ``tags_for(request, *args, **kwargs)`` names the tags, besides
+    ``catalog``, whose invalidation should drop the cached page.
+
+    ``async def`` views get an async wrapper, and their ``tags_for`` may be
+    ``async def`` too. The cache is still called directly there: the
+    local-memory and file backends answer without a network round trip,
+    while Django's async cache methods would hop to a thread for every key.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # auser() reads the session through its async API
+                if request.method not in ('GET', 'HEAD') or (await request.auser()).is_authenticated:
+                    return await view(request, *args, **kwargs)
+                tags = ()
+                if tags_for is not None:
+                    tags = tags_for(request, *args, **kwargs)
+                    if iscoroutinefunction(tags_for):
+                        tags = await tags
+                key, response = _serve_cached(request, tags)
+                if response is not None:
+                    return response
+                request.page_cache_render = True
+                try:
+                    response = await view(request, *args, **kwargs)
+                finally:
+                    request.page_cache_render = False
+                return _store_page(request, key, response)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            tags = tags_for(request, *args, **kwargs) if tags_for is not None else ()
+            key, response = _serve_cached(request, tags)
+            if response is not None:
+                return response
+
+            request.page_cache_render = True
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                request.page_cache_render = False
+            return _store_page(request, key, response)
+        return wrapper
+    return decorator
@@ -0,0 +1,229 @@
+"""Shopping cart kept in a signed cookie.
+
+The cart is a ``{product_id: qty}`` mapping serialised as ``"12:1:99900.40:2"``
+(id, quantity and the unit price in cents seen when the item was added) and
+signed so visitors cannot edit it. Adding, removing or changing a line is a
+dict operation and the item count is kept as a running total, so nothing is
+scanned and no session row is written on every click. :class:`CartMiddleware`
+loads the cart into ``request.cart`` and writes the cookie back only when the
+cart changed.
+
+Names, images and the prices charged are never taken from the cookie;
+:meth:`Cart.items` reads them live from the catalog in one query and flags
+lines whose price or stock changed since they were added.
+"""
+from decimal import Decimal
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+
+COOKIE_NAME = getattr(settings, 'DEVLOOM_CART_COOKIE_NAME', 'devloom_cart')
+COOKIE_AGE = getattr(settings, 'DEVLOOM_CART_COOKIE_AGE', 60 * 60 * 24 * 30)
+COOKIE_SALT = 'devloom.cart'
+# keeps the signed cookie well under the 4 KB browsers accept
+MAX_LINES = 100
+MAX_QTY = 99
+
+
+class Cart:
+    """A visitor's cart: product id -> quantity, plus the total quantity."""
+
+    def __init__(self, lines=None, seen_prices=None):
+        self.lines = {}
+        # unit price (in cents) shown when each line was added
+        self.seen_prices = {}
+        self.count = 0
+        self.modified = False
+        for product_id, qty in (lines or {}).items():
+            self.set(product_id, qty)
+        for product_id, cents in (seen_prices or {}).items():
+            if product_id in self.lines:
+                self.seen_prices[product_id] = cents
+        self.modified = False
+
+    # --- (de)serialisation ---
+
+    def dumps(self):
+        return '.'.join(
+            f'{pid}:{qty}:{self.seen_prices[pid]}' if pid in self.seen_prices else f'{pid}:{qty}'
+            for pid, qty in self.lines.items()
+        )
+
+    @classmethod
+    def loads(cls, value):
+        """Parse a ``dumps()`` string; malformed lines are dropped."""
+        lines, seen_prices = {}, {}
+        for part in (value or '').split('.'):
+            pid, _, rest = part.partition(':')
+            qty, _, cents = rest.partition(':')
+            try:
+                lines[int(pid)] = int(qty)
+                if cents:
+                    seen_prices[int(pid)] = int(cents)
+            except ValueError:
+                continue
+        return cls(lines, seen_prices)
+
+    @classmethod
+    def from_request(cls, request):
+        value = request.get_signed_cookie(COOKIE_NAME, default='', salt=COOKIE_SALT, max_age=COOKIE_AGE)
+        return cls.loads(value)
+
+    def save(self, response):
+        if self.lines:
+            response.set_signed_cookie(COOKIE_NAME, self.dumps(), salt=COOKIE_SALT, max_age=COOKIE_AGE,
+                                       httponly=True, samesite='Lax',
+                                       secure=getattr(settings, 'SESSION_COOKIE_SECURE', False))
+        else:
+            response.delete_cookie(COOKIE_NAME, samesite='Lax')
+
+    # --- updates, all O(1) ---
+
+    def set(self, product_id, qty):
+        """Set a line's quantity; ``qty <= 0`` removes the line."""
+        product_id, qty = int(product_id), min(int(qty), MAX_QTY)
+        old = self.lines.get(product_id, 0)
+        if qty <= 0:
+            if product_id not in self.lines:
+                return
+            del self.lines[product_id]
+            self.seen_prices.pop(product_id, None)
+            qty = 0
+        elif product_id in self.lines or len(self.lines) < MAX_LINES:
+            self.lines[product_id] = qty
+        else:
+            return
+        self.count += qty - old
+        self.modified = True
+
+    def add(self, product_id, qty=1, price=None):
+        """Add ``qty`` units; ``price`` is the unit price the visitor saw."""
+        product_id = int(product_id)
+        self.set(product_id, self.lines.get(product_id, 0) + qty)
+        if price is not None and product_id in self.lines:
+            cents = to_cents(price)
+            if self.seen_prices.get(product_id) != cents:
+                self.seen_prices[product_id] = cents
+                self.modified = True
+
+    def remove(self, product_id):
+        self.set(product_id, 0)
+
+    def clear(self):
+        if self.lines:
+            self.lines.clear()
+            self.seen_prices.clear()
+            self.count = 0
+            self.modified = True
+
+    def __contains__(self, product_id):
+        return int(product_id) in self.lines
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    def ids(self):
+        return list(self.lines)
+
+    # --- catalog data ---
+
+    def items(self):
+        """Cart lines priced from the catalog, in the order they were added.
+
+        Each line is a dict with ``id, name, image, qty, stock``, the live
+        unit ``price`` and ``line_total`` as Decimals, and two flags:
+        ``price_changed`` (with ``seen_price``) when the price moved since the
+        item was added, and ``short`` when fewer than ``qty`` are in stock.
+        Products that no longer exist are left out. One query per cart.
+        """
+        products = _product_columns().in_bulk(self.ids())
+        return self._priced(products)
+
+    async def aitems(self):
+        """:meth:`items` for async views, through the async ORM."""
+        products = await _product_columns().ain_bulk(self.ids())
+        return self._priced(products)
+
+    def _priced(self, products):
+        items = []
+        for pid, qty in self.lines.items():
+            product = products.get(pid)
+            if product is None:
+                continue
+            seen = self.seen_prices.get(pid)
+            seen_price = from_cents(seen) if seen is not None else None
+            items.append({
+                'id': pid,
+                'name': product.name,
+                'image': product.image or '',
+                'qty': qty,
+                'price': product.price,
+                'line_total': product.price * qty,
+                'stock': product.stock,
+                'short': product.stock < qty,
+                'seen_price': seen_price,
+                'price_changed': seen_price is not None and seen_price != product.price,
+            })
+        return items
+
+    def accept_prices(self, items):
+        """Record the prices in ``items`` as seen, clearing ``price_changed``."""
+        for it in items:
+            if it['price_changed'] or it['id'] not in self.seen_prices:
+                self.seen_prices[it['id']] = to_cents(it['price'])
+                self.modified = True
+
+
+def _product_columns():
+    from .models import Product
+
+    return Product.objects.only('id', 'name', 'price', 'image', 'stock')
+
+
+def to_cents(price):
+    return int((Decimal(str(price)) * 100).to_integral_value())
+
+
+def from_cents(cents):
+    return Decimal(cents) / 100
+
+
+def subtotal(items):
+    """Sum of ``line_total`` over hydrated cart lines, as a Decimal."""
+    return sum((it['line_total'] for it in items), Decimal('0.00'))
+
+
+class CartMiddleware:
+    """Attach ``request.cart`` and persist it when a view changed it.
+
+    Runs natively under both WSGI and ASGI, so async views are not
+    switched to a thread and back on its account.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        request.cart = Cart.from_request(request)
+        response = self.get_response(request)
+        if request.cart.modified:
+            request.cart.save(response)
+        return response
+
+    async def __acall__(self, request):
+        request.cart = Cart.from_request(request)
+        response = await self.get_response(request)
+        if request.cart.modified:
+            request.cart.save(response)
+        return response
@@ -0,0 +1,244 @@
+"""Streaming catalog import and export (`manage.py import_catalog` / `export_catalog`).
+
+A catalog file is CSV (with a header row) or JSON Lines, one product per
+row with the COLUMNS below. Rows are read and written one at a time, so a
+file of any size is handled in constant memory.
+
+Imports upsert by ``sku``: rows are taken in chunks and each chunk runs in
+its own transaction: one SELECT of the chunk's existing products, one
+bulk_create of the new ones and an upsert (bulk_create with
+``update_conflicts``) of just the changed columns of the rest.
+Columns missing from a file are left alone on existing products. Bulk
+writes skip the model signals, so :func:`import_rows` refreshes category
+counts and invalidates the caches itself once the whole file is in.
+"""
+import csv
+import json
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from . import recommendations
+from .cache import invalidate_catalog
+from .models import Category, Product
+from .search import optimize_index
+from .specs import extract_specs
+
+COLUMNS = ('sku', 'name', 'category', 'price', 'stock', 'description', 'image')
+FORMATS = ('csv', 'jsonl')
+REQUIRED_FOR_CREATE = ('name', 'category', 'price')
+DEFAULT_BATCH_SIZE = 1000
+
+_MAX_LENGTHS = {'sku': 64, 'name': 200, 'category': 100, 'image': 255}
+_MAX_PRICE = Decimal('99999999.99')
+
+
+class RowError(ValueError):
+    def __init__(self, line, message):
+        super().__init__(f'line {line}: {message}')
+        self.line = line
+
+
+def detect_format(path, fmt=None):
+    """``fmt`` if given, else guessed from the file extension (CSV by default)."""
+    if fmt:
+        return fmt
+    return 'jsonl' if str(path).lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+# --- reading ---
+
+def read_rows(stream, fmt):
+    """Yield ``(line_number, row)`` pairs; rows are dicts of raw values."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, {k.strip(): v for k, v in row.items() if k}
+    else:
+        for line, text in enumerate(stream, 1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text, parse_float=Decimal)
+            except ValueError as exc:
+                # reported by clean_row, so one bad line doesn't end the import
+                yield line, exc
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def clean_row(line, raw):
+    """Validate a raw row into typed values, keeping only the columns present."""
+    if isinstance(raw, ValueError):
+        raise RowError(line, f'invalid JSON ({raw})')
+    if not isinstance(raw, dict):
+        raise RowError(line, 'expected a JSON object')
+    row = {}
+    for column in COLUMNS:
+        if column not in raw:
+            continue
+        value = raw[column]
+        if column == 'price':
+            try:
+                value = Decimal(_text(value)).quantize(Decimal('0.01'))
+            except InvalidOperation:
+                raise RowError(line, f'price {raw[column]!r} is not a number')
+            if not 0 <= value <= _MAX_PRICE:
+                raise RowError(line, f'price {value} is out of range')
+        elif column == 'stock':
+            text = _text(value) or '0'
+            try:
+                value = int(text)
+            except ValueError:
+                raise RowError(line, f'stock {raw[column]!r} is not a whole number')
+            if value < 0:
+                raise RowError(line, 'stock cannot be negative')
+        else:
+            value = _text(value)
+            if len(value) > _MAX_LENGTHS.get(column, len(value)):
+                raise RowError(line, f'{column} is longer than {_MAX_LENGTHS[column]} characters')
+            if column in ('description', 'image'):
+                value = value or None
+        row[column] = value
+    if not row.get('sku'):
+        raise RowError(line, 'sku is required')
+    for column in ('name', 'category'):
+        if column in row and not row[column]:
+            raise RowError(line, f'{column} cannot be blank')
+    return row
+
+
+# --- importing ---
+
+class ImportStats:
+    def __init__(self):
+        self.created = self.updated = self.unchanged = 0
+        self.errors = []
+
+    @property
+    def changed(self):
+        return self.created + self.updated
+
+
+def _category_ids(names, categories):
+    """Fill ``categories`` (name -> id) for ``names``, creating missing ones."""
+    for name in names - categories.keys():
+        categories[name] = Category.objects.get_or_create(name=name)[0].pk
+
+
+def _apply(product, row, categories):
+    """Copy ``row`` onto ``product``; returns the names of the fields changed.
+
+    Like Product.save(), specs are re-parsed only when the description
+    changed, so values corrected by hand survive a re-import.
+    """
+    changed = set()
+    for column, value in row.items():
+        attr = 'category_id' if column == 'category' else column
+        if column == 'category':
+            value = categories[value]
+        if getattr(product, attr) != value:
+            setattr(product, attr, value)
+            changed.add(attr)
+    if 'description' in changed:
+        product.ram_gb, product.storage_gb = extract_specs(product.description)
+        changed.update(('ram_gb', 'storage_gb'))
+    return changed
+
+
+def _import_chunk(chunk, categories, stats):
+    """Upsert one chunk (sku -> (line, row)) in a single transaction."""
+    with transaction.atomic():
+        _category_ids({row['category'] for _, row in chunk.values() if 'category' in row}, categories)
+        fields = ['id', 'category_id', 'ram_gb', 'storage_gb', *(c for c in COLUMNS if c != 'category')]
+        existing = Product.objects.only(*fields).in_bulk(list(chunk), field_name='sku')
+        new = []
+        # products grouped by the fields that changed, so a stock-only update
+        # does not rewrite (and re-index) names and descriptions
+        changed = defaultdict(list)
+        for sku, (line, row) in chunk.items():
+            product = existing.get(sku)
+            if product is None:
+                missing = [c for c in REQUIRED_FOR_CREATE if c not in row]
+                if missing:
+                    stats.errors.append(RowError(line, f"new product needs {', '.join(missing)}"))
+                    continue
+                product = Product()
+                _apply(product, row, categories)
+                new.append(product)
+                continue
+            fields = _apply(product, row, categories)
+            if fields:
+                changed[frozenset(fields)].append(product)
+            else:
+                stats.unchanged += 1
+        Product.objects.bulk_create(new)
+        for fields, products in changed.items():
+            # INSERT ... ON CONFLICT (sku) DO UPDATE: one statement per batch,
+            # about 3x faster than bulk_update's CASE WHEN per column
+            Product.objects.bulk_create(products, update_conflicts=True, unique_fields=['sku'],
+                                        update_fields=sorted(fields))
+            stats.updated += len(products)
+    stats.created += len(new)
+
+
+def import_rows(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """Upsert ``(line, raw_row)`` pairs (see :func:`read_rows`) into the catalog.
+
+    Invalid rows are skipped and collected in ``stats.errors``; a later row
+    with the same sku in one chunk wins. Returns an :class:`ImportStats`.
+    """
+    stats = ImportStats()
+    categories = dict(Category.objects.values_list('name', 'id'))
+    chunk = {}
+    for line, raw in rows:
+        try:
+            row = clean_row(line, raw)
+        except RowError as exc:
+            stats.errors.append(exc)
+            continue
+        chunk[row['sku']] = (line, row)
+        if len(chunk) >= batch_size:
+            _import_chunk(chunk, categories, stats)
+            chunk = {}
+    if chunk:
+        _import_chunk(chunk, categories, stats)
+
+    if stats.changed:
+        Category.refresh_product_counts()
+        invalidate_catalog()
+        recommendations.discard_candidate_pool()
+        # trigger-maintained FTS segments pile up during a bulk load
+        optimize_index()
+    return stats
+
+
+# --- exporting ---
+
+def export_rows(products=None, chunk_size=2000):
+    """Yield every product as a dict of COLUMNS, streaming in id order."""
+    products = Product.objects.all() if products is None else products
+    values = products.order_by('id').values_list(
+        'sku', 'name', 'category__name', 'price', 'stock', 'description', 'image')
+    for row in values.iterator(chunk_size=chunk_size):
+        yield dict(zip(COLUMNS, row))
+
+
+def write_rows(stream, rows, fmt):
+    """Write ``rows`` to ``stream`` as CSV or JSON Lines; returns the count."""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: '' if v is None else v for k, v in row.items()})
+            count += 1
+    else:
+        for row in rows:
+            row['price'] = str(row['price'])
+            stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+            count += 1
+    return count
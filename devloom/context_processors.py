@@ -1,22 +1,57 @@
-import time
+import hashlib
+from functools import cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+
+@cache
+def _static_version():
+    """Hash the collected manifest, or the app's CSS/JS when not collected yet.
+
+    Computed once per process; it only changes when asset contents do.
+    """
+    digest = hashlib.sha256()
+    manifest = settings.STATIC_ROOT and (settings.STATIC_ROOT / 'staticfiles.json')
+    if manifest and manifest.exists():
+        digest.update(manifest.read_bytes())
+    else:
+        for finder in finders.get_finders():
+            for path, storage in sorted(finder.list(ignore_patterns=None), key=lambda item: item[0]):
+                if path.endswith(('.css', '.js')):
+                    with storage.open(path) as fh:
+                        digest.update(path.encode())
+                        digest.update(fh.read())
+    return digest.hexdigest()[:12]
 
 
 def static_version(request):
     """Return a STATIC_VERSION value for cache-busting in templates.
 
-    In development this is a timestamp generated at import time so it's stable
-    for the lifetime of the process but changes when the server restarts.
+    `{% static %}` URLs are already content-hashed (see devloom.storage);
+    this is a digest of the asset contents for anything built by hand.
     """
-    return {"STATIC_VERSION": str(int(time.time()))}
+    return {"STATIC_VERSION": _static_version()}
 
 
 def cart_count(request):
-    """Return a small cart count from session for templates.
+    """Return the number of items in the cart for templates.
 
-    This is intentionally minimal: it reads `request.session['cart_count']`
-    and falls back to 0 when missing.
+    Reads the running total kept by devloom.cart.CartMiddleware and falls
+    back to 0 when there is no cart (e.g. the middleware is not installed).
     """
-    try:
-        return {"cart_count": int(request.session.get("cart_count", 0))}
-    except Exception:
-        return {"cart_count": 0}
+    cart = getattr(request, 'cart', None)
+    return {"cart_count": cart.count if cart is not None else 0}
+
+
+def page_cache_holes(request):
+    """Swap per-visitor values for placeholders while a page is being cached.
+
+    Listed last so it overrides `cart_count` and the built-in CSRF token;
+    devloom.cache fills the placeholders back in on every response.
+    """
+    if getattr(request, 'page_cache_render', False):
+        from .cache import CART_COUNT_PLACEHOLDER, CSRF_TOKEN_PLACEHOLDER
+
+        return {'cart_count': CART_COUNT_PLACEHOLDER, 'csrf_token': CSRF_TOKEN_PLACEHOLDER}
+    return {}
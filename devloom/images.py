@@ -0,0 +1,347 @@
+"""Shared helpers for the product image folder and its derivatives."""
+import hashlib
+import json
+import math
+import os
+import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+
+IMAGES_DIR = Path(settings.BASE_DIR) / 'devloom' / 'static' / 'devloom' / 'images'
+IMAGE_EXTENSIONS = ('png', 'jpg', 'jpeg', 'webp', 'gif', 'svg')
+STATIC_PREFIX = 'devloom/images/'
+
+# size, mtime and hashes of every image seen by `manage.py ensure_images_products`
+# and `dedupe_images`; a dotfile, so collectstatic leaves it out
+SCAN_MANIFEST = IMAGES_DIR / '.scan-manifest.json'
+
+# resized copies written by `manage.py build_image_variants`
+VARIANTS_DIR = IMAGES_DIR / 'variants'
+VARIANT_MANIFEST = VARIANTS_DIR / 'manifest.json'
+VARIANT_WIDTHS = (320, 640, 960)
+# listed in order of preference; browsers take the first type they support
+VARIANT_FORMATS = ('avif', 'webp', 'jpeg')
+
+
+def list_image_files(images_dir=IMAGES_DIR):
+    """Return the image filenames directly inside ``images_dir``, sorted."""
+    if not os.path.isdir(images_dir):
+        return []
+    return sorted(
+        f for f in os.listdir(images_dir)
+        if os.path.isfile(os.path.join(images_dir, f)) and f.split('.')[-1].lower() in IMAGE_EXTENSIONS
+    )
+
+
+def static_path(fname):
+    return f'{STATIC_PREFIX}{fname}'
+
+
+def scan_image_files(images_dir=IMAGES_DIR):
+    """``{filename: (size, mtime_ns)}`` for the images in ``images_dir``.
+
+    One ``scandir`` pass; the stat comes with each directory entry.
+    """
+    found = {}
+    try:
+        entries = os.scandir(images_dir)
+    except OSError:
+        return found
+    with entries:
+        for entry in entries:
+            if entry.name.split('.')[-1].lower() in IMAGE_EXTENSIONS and entry.is_file():
+                st = entry.stat()
+                found[entry.name] = (st.st_size, st.st_mtime_ns)
+    return found
+
+
+def dhash(img, size=8):
+    """64-bit difference hash of a PIL image, as 16 hex digits.
+
+    Each bit says whether a pixel of a tiny greyscale thumbnail is brighter
+    than its right neighbour, so re-encoded, resized or lightly edited
+    copies of a picture hash to the same or nearby values.
+    """
+    from PIL import Image
+
+    img.draft('L', (size * 4, size * 4))  # JPEG decodes at reduced scale
+    pixels = img.convert('L').resize((size + 1, size), Image.Resampling.LANCZOS).tobytes()
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            i = row * (size + 1) + col
+            bits = bits << 1 | (pixels[i] > pixels[i + 1])
+    return f'{bits:016x}'
+
+
+def hamming(a, b):
+    """Number of differing bits between two ``dhash`` values."""
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def file_metadata(path):
+    """``(sha256, width, height, dhash)`` of an image file.
+
+    The last three are None without Pillow or for SVGs. A plain function so
+    it can run in a process pool.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    width = height = phash = None
+    try:
+        from PIL import Image
+
+        with Image.open(path) as img:
+            width, height = img.size
+            phash = dhash(img)
+    except Exception:  # no Pillow, SVG, or a damaged file
+        pass
+    return digest.hexdigest(), width, height, phash
+
+
+# below this many files a process pool costs more than it saves
+POOL_THRESHOLD = 16
+# dhash bits (of 64) two files may differ by and still be the same picture
+NEAR_DUPLICATE_DISTANCE = 6
+
+
+def hash_files(fnames, images_dir=IMAGES_DIR, workers=None):
+    """:func:`file_metadata` for each name, in a process pool when there are many."""
+    paths = [str(Path(images_dir) / f) for f in fnames]
+    if len(paths) < POOL_THRESHOLD or workers == 1:
+        return list(map(file_metadata, paths))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(file_metadata, paths, chunksize=8))
+
+
+# --- scan manifest ---
+
+def load_scan_manifest(path=SCAN_MANIFEST):
+    """``{filename: entry}``; entries hold ``size, mtime_ns, sha256, width,
+    height, dhash`` and, once handled, ``product`` or ``duplicate_of``."""
+    try:
+        return json.loads(Path(path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_scan_manifest(manifest, path=SCAN_MANIFEST):
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding='utf-8')
+    os.replace(tmp, path)
+
+
+def refresh_scan_manifest(manifest, files, images_dir=IMAGES_DIR, workers=None):
+    """Bring ``manifest`` in line with ``files`` (from :func:`scan_image_files`).
+
+    Entries of removed files are dropped; files that are new or whose size
+    or mtime moved are hashed. A file whose content turns out unchanged
+    keeps its ``product`` / ``duplicate_of``. Returns the names hashed.
+    """
+    for fname in [f for f in manifest if f not in files]:
+        del manifest[fname]
+    stale = sorted(f for f, stat in files.items()
+                   if f not in manifest or 'dhash' not in manifest[f]
+                   or (manifest[f].get('size'), manifest[f].get('mtime_ns')) != stat)
+    for fname, (sha256, width, height, phash) in zip(stale, hash_files(stale, images_dir, workers)):
+        old = manifest.get(fname, {})
+        size, mtime_ns = files[fname]
+        entry = {'size': size, 'mtime_ns': mtime_ns, 'sha256': sha256,
+                 'width': width, 'height': height, 'dhash': phash}
+        if old.get('sha256') == sha256:
+            entry.update((k, old[k]) for k in ('product', 'duplicate_of') if k in old)
+        manifest[fname] = entry
+    return stale
+
+
+def duplicate_groups(entries, max_distance=0):
+    """Sets of filenames showing the same picture, from manifest entries.
+
+    Files match on equal ``sha256``, or with ``max_distance`` > 0 on
+    ``dhash`` values at most that many bits apart. Near matches are found by
+    splitting the hash into ``max_distance + 1`` bands: two hashes within the
+    distance agree on at least one band, so only files sharing a band value
+    are compared, rather than every pair.
+    """
+    parent = {f: f for f in entries}
+
+    def find(f):
+        while parent[f] != f:
+            parent[f] = parent[parent[f]]
+            f = parent[f]
+        return f
+
+    def union(a, b):
+        parent[find(a)] = find(b)
+
+    by_sha = {}
+    for fname, entry in entries.items():
+        first = by_sha.setdefault(entry.get('sha256'), fname)
+        if first != fname and entry.get('sha256'):
+            union(fname, first)
+
+    hashed = [(f, int(e['dhash'], 16)) for f, e in entries.items() if e.get('dhash')]
+    if max_distance > 0 and hashed:
+        bands = min(max_distance + 1, 64)
+        bounds = [(64 * i // bands, 64 * (i + 1) // bands) for i in range(bands)]
+        for lo, hi in bounds:
+            buckets = defaultdict(list)
+            for fname, value in hashed:
+                buckets[value >> lo & ((1 << (hi - lo)) - 1)].append((fname, value))
+            for bucket in buckets.values():
+                for i, (a, va) in enumerate(bucket):
+                    for b, vb in bucket[i + 1:]:
+                        if (va ^ vb).bit_count() <= max_distance:
+                            union(a, b)
+
+    groups = defaultdict(set)
+    for fname in entries:
+        groups[find(fname)].add(fname)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+_manifest_cache = {'mtime': None, 'data': {}}
+
+
+def load_variant_manifest():
+    """Return the variant manifest, re-reading it only when the file changes.
+
+    Maps a ``Product.image`` path to ``{'width', 'height', 'hash', 'variants':
+    {format: [[width, static_path], ...]}}``; empty when nothing was built.
+    """
+    try:
+        mtime = VARIANT_MANIFEST.stat().st_mtime
+    except OSError:
+        return {}
+    if mtime != _manifest_cache['mtime']:
+        with open(VARIANT_MANIFEST, encoding='utf-8') as fh:
+            _manifest_cache['data'] = json.load(fh)
+        _manifest_cache['mtime'] = mtime
+    return _manifest_cache['data']
+
+
+def image_variants(image_path):
+    return load_variant_manifest().get(image_path)
+
+
+# --- matching image files to products ---
+
+# filename keyword -> category name (lowercase); the first keyword found wins
+CATEGORY_KEYWORDS = {
+    'laptop': 'laptops', 'notebook': 'laptops', 'macbook': 'laptops',
+    'desktop': 'desktops', 'tower': 'desktops', 'workstation': 'desktops',
+    'accessory': 'accessories', 'accessories': 'accessories', 'mouse': 'accessories',
+    'keyboard': 'accessories', 'bag': 'accessories', 'charger': 'accessories',
+}
+# shorter words ("hp", "a") match too many names to mean anything; numbers
+# ("Laptop 3") always count
+MIN_TOKEN_LENGTH = 3
+COMMON_TOKEN_MIN = 50
+
+_TOKEN_SPLIT = re.compile(r'[^a-z0-9]+')
+
+
+def name_tokens(text):
+    """Lowercase alphanumeric tokens of a product name or filename stem."""
+    return {t for t in _TOKEN_SPLIT.split(text.lower()) if len(t) >= MIN_TOKEN_LENGTH or t.isdigit()}
+
+
+def infer_category(fname, categories):
+    """Category id for ``fname`` from CATEGORY_KEYWORDS (``categories``: lowercase name -> id)."""
+    fn = fname.lower()
+    for keyword, category in CATEGORY_KEYWORDS.items():
+        if keyword in fn and category in categories:
+            return categories[category]
+    return None
+
+
+class ProductNameIndex:
+    """Inverted index from name tokens to products, for matching filenames.
+
+    Built once from ``(id, name, category_id, image)`` tuples. A filename
+    scores each product sharing a token with it by the tokens' inverse
+    document frequency, so "thinkpad" outweighs "pro"; products whose
+    whole name appears in the filename rank above all others. Ties go to
+    a product no earlier file took, then to the lowest id, so the same files
+    and catalog always give the same result.
+    """
+
+    def __init__(self, products):
+        self.products = {}
+        self.postings = defaultdict(list)
+        self.imageless = defaultdict(list)  # category id -> ids, ascending
+        self.by_category = defaultdict(list)
+        for pk, name, category_id, image in sorted(products):
+            tokens = name_tokens(name)
+            self.products[pk] = (name, category_id, tokens)
+            for token in tokens:
+                self.postings[token].append(pk)
+            self.by_category[category_id].append(pk)
+            if not image:
+                self.imageless[category_id].append(pk)
+        # words in more names than this ("laptop", "black") are ignored, which
+        # bounds the work per file on large catalogs
+        self.common_limit = max(COMMON_TOKEN_MIN, len(self.products) // 100)
+
+    def _idf(self, token):
+        return math.log(1 + len(self.products) / len(self.postings[token]))
+
+    def best_match(self, fname, category_id=None, whole_name_only=False, claimed=()):
+        """Id of the best product for ``fname`` (optionally within a category), or None."""
+        file_tokens = name_tokens(os.path.splitext(fname)[0])
+        scores = defaultdict(float)
+        for token in file_tokens & self.postings.keys():
+            if len(self.postings[token]) > self.common_limit:
+                continue
+            weight = self._idf(token)
+            for pk in self.postings[token]:
+                if category_id is None or self.products[pk][1] == category_id:
+                    scores[pk] += weight
+        best, best_key = None, None
+        for pk, score in scores.items():
+            whole = self.products[pk][2] <= file_tokens
+            if whole_name_only and not whole:
+                continue
+            key = (whole, score, pk not in claimed, -pk)
+            if best_key is None or key > best_key:
+                best, best_key = pk, key
+        return best
+
+    def match(self, files, categories):
+        """``[(fname, product_id or None)]`` for ``files``, in one pass.
+
+        Files whose name implies a category take the best-scoring product in
+        it, else the next product there still without an image, else its
+        first product. Other files only match a product whose whole name is
+        in the filename.
+        """
+        claimed = set()
+        next_imageless = defaultdict(int)
+        assignments = []
+        for fname in files:
+            category_id = infer_category(fname, categories)
+            if category_id is None:
+                pk = self.best_match(fname, whole_name_only=True, claimed=claimed)
+            else:
+                pk = self.best_match(fname, category_id, claimed=claimed)
+                if pk is None:
+                    # hand each unmatched file its own imageless product
+                    waiting = self.imageless[category_id]
+                    i = next_imageless[category_id]
+                    while i < len(waiting) and waiting[i] in claimed:
+                        i += 1
+                    next_imageless[category_id] = i + 1
+                    if i < len(waiting):
+                        pk = waiting[i]
+                    elif self.by_category[category_id]:
+                        pk = self.by_category[category_id][0]
+            if pk is not None:
+                claimed.add(pk)
+            assignments.append((fname, pk))
+        return assignments
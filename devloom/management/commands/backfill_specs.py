@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from devloom.cache import invalidate_catalog
+from devloom.models import Product
+from devloom.specs import extract_specs
+
+
+class Command(BaseCommand):
+    help = 'Parse RAM/SSD specs out of product descriptions into the indexed ram_gb/storage_gb columns.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Re-parse every product, not just those with no specs yet')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        products = Product.objects.only('id', 'description', 'ram_gb', 'storage_gb').order_by('id')
+        if not options['all']:
+            products = products.filter(ram_gb__isnull=True, storage_gb__isnull=True)
+
+        scanned = updated = 0
+        batch = []
+        for product in products.iterator(chunk_size=batch_size):
+            scanned += 1
+            specs = extract_specs(product.description)
+            if specs != (product.ram_gb, product.storage_gb):
+                product.ram_gb, product.storage_gb = specs
+                batch.append(product)
+            if len(batch) >= batch_size:
+                updated += self._flush(batch)
+        updated += self._flush(batch)
+
+        if updated:
+            # bulk_update skips signals; detail pages show these specs
+            invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS(f'Scanned {scanned} products, updated specs on {updated}.'))
+
+    @staticmethod
+    def _flush(batch):
+        count = len(batch)
+        if count:
+            with transaction.atomic():
+                Product.objects.bulk_update(batch, ['ram_gb', 'storage_gb'])
+            batch.clear()
+        return count
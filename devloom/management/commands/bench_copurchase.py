@@ -0,0 +1,136 @@
+from django.core.management.base import BaseCommand
+from collections import Counter
+import random
+import time
+import tracemalloc
+
+from devloom.benchmarks import percentile, throwaway_database
+from devloom.models import Category, Product
+from devloom.recommendations import SKETCH_SIZE, TOP_K, bought_together, fold_order, record_order, top_neighbors
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the co-purchase sketch on a synthetic order history: fold throughput, '
+            'memory, lookup latency and top-K agreement with exact counts, then record_order and '
+            'bought_together against a throwaway copy of the configured database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--line-items', type=int, default=1_000_000)
+        parser.add_argument('--products', type=int, default=20_000)
+        parser.add_argument('--bundle-size', type=int, default=8,
+                            help='Products per "bundle"; orders mostly draw from one bundle')
+        parser.add_argument('--sample', type=int, default=200,
+                            help='Products whose exact neighbour counts are checked')
+        parser.add_argument('--db-orders', type=int, default=5000,
+                            help='Orders passed through record_order on the database (0 to skip)')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        orders = list(self._synthetic_orders(rng, options))
+        line_items = sum(len(order) for order in orders)
+        self.stdout.write(f'{len(orders)} orders, {line_items} line items, {options["products"]} products')
+
+        sketches = {}
+        started = time.perf_counter()
+        for order in orders:
+            fold_order(sketches, order)
+        fold_seconds = time.perf_counter() - started
+
+        # tracemalloc slows allocation down a lot, so measure memory on a second pass
+        tracemalloc.start()
+        traced = {}
+        for order in orders:
+            fold_order(traced, order)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del traced
+
+        tops = {pid: top_neighbors(counts) for pid, counts in sketches.items()}
+        probes = rng.sample(list(tops), min(10_000, len(tops)))
+        started = time.perf_counter()
+        for pid in probes:
+            tops.get(pid)
+        lookup_us = (time.perf_counter() - started) / max(1, len(probes)) * 1e6
+
+        agreement = self._agreement(rng, orders, tops, options['sample'])
+
+        counters = sum(len(counts) for counts in sketches.values())
+        self.stdout.write(f'fold:      {fold_seconds:.2f}s ({line_items / fold_seconds:,.0f} line items/s)')
+        self.stdout.write(f'memory:    {peak / 2**20:.1f} MiB peak, {counters:,} counters '
+                          f'(<= {SKETCH_SIZE} per product)')
+        self.stdout.write(f'lookup:    {lookup_us:.2f} us per product')
+        self.stdout.write(self.style.SUCCESS(
+            f'top-{TOP_K} agreement with exact counts: {agreement:.1%} over {options["sample"]} products'))
+
+        if options['db_orders'] > 0:
+            self._bench_database(rng, orders[:options['db_orders']], options['products'])
+
+    def _bench_database(self, rng, orders, products):
+        """Time record_order per order and bought_together per product lookup."""
+        with throwaway_database():
+            category = Category.objects.create(name='Bench')
+            Product.objects.bulk_create([
+                Product(category=category, name=f'Bench product {i}', price=1, stock=1)
+                for i in range(products)
+            ], batch_size=1000)
+            ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+
+            recorded = []
+            started = time.perf_counter()
+            for order in orders:
+                tick = time.perf_counter()
+                record_order([ids[index] for index in order])
+                recorded.append((time.perf_counter() - tick) * 1000)
+            record_seconds = time.perf_counter() - started
+
+            looked_up = []
+            for pid in rng.sample(ids, min(2000, len(ids))):
+                tick = time.perf_counter()
+                bought_together(pid)
+                looked_up.append((time.perf_counter() - tick) * 1000)
+
+        recorded.sort()
+        looked_up.sort()
+        self.stdout.write(f'record_order:    {len(orders) / record_seconds:8,.0f} orders/s  '
+                          f'p50 {percentile(recorded, 50):.2f} ms  p95 {percentile(recorded, 95):.2f} ms  '
+                          f'p99 {percentile(recorded, 99):.2f} ms')
+        self.stdout.write(f'bought_together: p50 {percentile(looked_up, 50):.2f} ms  '
+                          f'p95 {percentile(looked_up, 95):.2f} ms  p99 {percentile(looked_up, 99):.2f} ms')
+
+    @staticmethod
+    def _synthetic_orders(rng, options):
+        """Orders of 1-6 items, ~80% drawn from one bundle, the rest anywhere."""
+        products, bundle_size = options['products'], options['bundle_size']
+        remaining = options['line_items']
+        while remaining > 0:
+            size = min(remaining, rng.choice((1, 1, 2, 2, 3, 3, 4, 5, 6)))
+            start = rng.randrange(0, products, bundle_size)
+            order = [
+                start + rng.randrange(bundle_size) if rng.random() < 0.8 else rng.randrange(products)
+                for _ in range(size)
+            ]
+            remaining -= size
+            yield order
+
+    @staticmethod
+    def _agreement(rng, orders, tops, sample):
+        """Share of exact top-K neighbours that the sketch also ranks in its top-K.
+
+        Neighbours tied with the first one outside the top-K are left out:
+        which of them makes the cut is arbitrary, exact counts or not.
+        """
+        chosen = set(rng.sample(list(tops), min(sample, len(tops))))
+        exact = {pid: Counter() for pid in chosen}
+        for order in orders:
+            ids = set(order)
+            for pid in ids & chosen:
+                exact[pid].update(ids - {pid})
+        hits = total = 0
+        for pid, counts in exact.items():
+            ranked = counts.most_common(TOP_K + 1)
+            cutoff = ranked[TOP_K][1] if len(ranked) > TOP_K else 0
+            truth = {other for other, n in ranked[:TOP_K] if n > cutoff}
+            hits += len(truth & set(tops[pid]))
+            total += len(truth)
+        return hits / total if total else 1.0
@@ -0,0 +1,109 @@
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+import multiprocessing
+import random
+import time
+
+from devloom.benchmarks import percentile, throwaway_database
+from devloom.models import Category, Product
+from devloom.orders import OutOfStock, create_order
+
+
+class Command(BaseCommand):
+    help = ('Benchmark catalog reads running alongside checkouts on a throwaway copy of the configured '
+            'database: read latency percentiles, the longest read stall, and order throughput. Compare '
+            'DB_SQLITE_JOURNAL_MODE=delete against the default WAL.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Processes browsing the catalog')
+        parser.add_argument('--writers', type=int, default=2, help='Processes placing orders')
+        parser.add_argument('--seconds', type=float, default=10.0)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self._seed(options['products'])
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode' if connection.vendor == 'sqlite' else 'SELECT version()')
+                mode = cursor.fetchone()[0]
+            self.stdout.write(f'{connection.vendor} ({mode}), {options["readers"]} readers, '
+                              f'{options["writers"]} writers, {options["seconds"]:.0f}s')
+            reads, writes, errors = self._run(options)
+
+        reads.sort()
+        writes.sort()
+        seconds = options['seconds']
+        self.stdout.write(f'reads:  {len(reads) / seconds:8.0f}/s  p50 {percentile(reads, 50):6.1f} ms  '
+                          f'p95 {percentile(reads, 95):6.1f} ms  p99 {percentile(reads, 99):6.1f} ms  '
+                          f'max {reads[-1] if reads else 0:6.1f} ms')
+        self.stdout.write(f'orders: {len(writes) / seconds:8.0f}/s  p50 {percentile(writes, 50):6.1f} ms  '
+                          f'p95 {percentile(writes, 95):6.1f} ms  p99 {percentile(writes, 99):6.1f} ms  '
+                          f'max {writes[-1] if writes else 0:6.1f} ms')
+        style = self.style.WARNING if errors else self.style.SUCCESS
+        self.stdout.write(style(f'{len(errors)} operations failed' + (f', e.g. {errors[0]}' if errors else '')))
+
+    @staticmethod
+    def _seed(count):
+        categories = [Category.objects.create(name=name) for name in ('Laptops', 'Desktops', 'Accessories')]
+        Product.objects.bulk_create([
+            Product(category=categories[i % 3], name=f'Bench product {i}', price=100 + i % 900,
+                    stock=1_000_000, description=f'{8 << i % 3}GB RAM {256 << i % 2}GB SSD')
+            for i in range(count)
+        ], batch_size=1000)
+        Category.refresh_product_counts()
+
+    def _run(self, options):
+        """Run the readers and writers as forked processes, like web workers.
+
+        Processes rather than threads, so the GIL does not blur which waits
+        come from the database. Returns ``(read_ms, write_ms, errors)``.
+        """
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        category_ids = list(Category.objects.values_list('id', flat=True))
+        # children must open their own connections
+        connection.close()
+        ctx = multiprocessing.get_context('fork')
+        results = ctx.Queue()
+        deadline = time.monotonic() + options['seconds']
+
+        def browse(rng):
+            # what the product list and detail views query
+            products = Product.objects.select_related('category').order_by('-created_at', '-id')
+            if rng.random() < 0.5:
+                products = products.filter(category_id=rng.choice(category_ids))
+            list(products[:24])
+            Product.objects.select_related('category').get(pk=rng.choice(product_ids))
+
+        def checkout(rng):
+            lines = [{'id': pk, 'name': 'Bench', 'price': 100, 'qty': 1}
+                     for pk in rng.sample(product_ids, rng.randint(1, 3))]
+            create_order('Bench Customer', 'bench@example.com', lines)
+
+        def worker(kind, work, seed):
+            rng = random.Random(seed)
+            timings, errors = [], []
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    work(rng)
+                except (OperationalError, OutOfStock) as exc:
+                    errors.append(f'{type(exc).__name__}: {exc}')
+                else:
+                    timings.append((time.perf_counter() - started) * 1000)
+            connection.close()
+            results.put((kind, timings, errors))
+
+        jobs = [('read', browse)] * options['readers'] + [('write', checkout)] * options['writers']
+        processes = [ctx.Process(target=worker, args=(kind, work, options['seed'] + i))
+                     for i, (kind, work) in enumerate(jobs)]
+        for process in processes:
+            process.start()
+        reads, writes, errors = [], [], []
+        for _ in processes:
+            kind, timings, failed = results.get()
+            (reads if kind == 'read' else writes).extend(timings)
+            errors.extend(failed)
+        for process in processes:
+            process.join()
+        return reads, writes, errors
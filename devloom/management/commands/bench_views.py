@@ -0,0 +1,257 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from io import StringIO
+import django
+import gc
+import itertools
+import json
+import platform
+import resource
+import time
+import tracemalloc
+
+from devloom.benchmarks import percentile, throwaway_database
+from devloom.cache import PRODUCTS_TAG, bump_tags
+from devloom.cart import COOKIE_NAME, Cart
+from devloom.models import OrderItem, Product
+from devloom.pagination import paginate
+from devloom.urls import urlpatterns
+
+# /metrics answers only a scraper sending the configured token
+METRICS_TOKEN = 'bench'
+
+
+class Command(BaseCommand):
+    help = ('Benchmark every route in devloom/urls.py through the test client against synthetic catalogs '
+            '(seed_devloom) on a throwaway database: latency percentiles, queries and peak memory per '
+            'request. --save writes the results as a JSON baseline; --baseline fails the run on regressions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,10000,100000', help='Catalog sizes (products), comma separated')
+        parser.add_argument('--orders-per-product', type=float, default=0.5, help='Order history size per product')
+        parser.add_argument('--requests', type=int, default=30, help='Timed requests per route and size')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--route', action='append', dest='routes', metavar='NAME',
+                            help='Only benchmark this URL name (repeatable)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--save', metavar='PATH', help='Write the results as a JSON baseline')
+        parser.add_argument('--baseline', metavar='PATH', help='Compare against a saved baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative growth of p95 latency and peak memory (default 0.25)')
+        parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                            help='Ignore p95 growth smaller than this, which is noise on fast routes')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as fh:
+                    baseline = json.load(fh)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read baseline {options["baseline"]}: {exc}')
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',')})
+        except ValueError:
+            raise CommandError('--sizes takes comma separated integers, e.g. 100,10000')
+
+        results = {
+            'meta': {'python': platform.python_version(), 'django': django.get_version(),
+                     'requests': options['requests']},
+            'sizes': {},
+        }
+        # a private cache, so the bench neither reads nor invalidates the site's pages
+        bench_settings = override_settings(
+            ALLOWED_HOSTS=['testserver'],
+            DEVLOOM_METRICS_TOKEN=METRICS_TOKEN,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                'LOCATION': 'devloom-bench'}},
+        )
+        with bench_settings, throwaway_database():
+            results['meta']['database'] = connection.vendor
+            for size in sizes:
+                # the catalog grows between sizes rather than being reseeded
+                call_command('seed_devloom', products=size, orders=int(size * options['orders_per_product']),
+                             seed=options['seed'], stdout=StringIO())
+                self.stdout.write(f'\n{size} products:')
+                routes = self._run_size(options)
+                rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+                results['sizes'][str(size)] = {'rss_mb': round(rss_mb, 1), 'routes': routes}
+                self.stdout.write(f'  process max RSS {rss_mb:.0f} MB')
+
+        if options['save']:
+            with open(options['save'], 'w') as fh:
+                json.dump(results, fh, indent=2, sort_keys=True)
+                fh.write('\n')
+            self.stdout.write(self.style.SUCCESS(f'\nSaved results to {options["save"]}.'))
+
+        failures = [f'{size} products, {label}: {error}' for size, data in results['sizes'].items()
+                    for label, row in data['routes'].items() if (error := row.get('error'))]
+        if baseline is not None:
+            failures += compare(baseline, results, options['tolerance'], options['min_delta_ms'])
+        if failures:
+            for failure in failures:
+                self.stdout.write(self.style.ERROR(f'  {failure}'))
+            raise CommandError(f'{len(failures)} benchmark failures.')
+        if baseline is not None:
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {options["baseline"]}.'))
+
+    def _run_size(self, options):
+        fixture = self._fixture()
+        scenarios = scenarios_for(fixture)
+        missing = {p.name for p in urlpatterns} - {s['route'] for s in scenarios}
+        if missing:
+            raise CommandError(f'No benchmark scenario for route(s): {", ".join(sorted(missing))}')
+        if options['routes']:
+            scenarios = [s for s in scenarios if s['route'] in options['routes']]
+
+        # pages cached by an earlier size or run would answer the unique paths below
+        cache.clear()
+        client = Client()
+        rows = {}
+        self.stdout.write(f'  {"route":<28} {"p50":>9} {"p95":>9} {"p99":>9} {"queries":>7} {"peak KB":>8}')
+        for scenario in scenarios:
+            serial = itertools.count()
+
+            def request():
+                # the cart cookie is reset every time, so order and cart routes repeat the same work
+                client.cookies[COOKIE_NAME] = fixture['cart_cookie']
+                if 'before' in scenario:
+                    scenario['before']()
+                path = scenario['path']
+                if scenario['method'] == 'get':
+                    # a unique query string, so the page cache never answers
+                    path += f'{"&" if "?" in path else "?"}bench={next(serial)}'
+                    return client.get(path, headers=scenario.get('headers'))
+                return client.post(path, scenario.get('data', {}))
+
+            for _ in range(options['warmup']):
+                request()
+            gc.collect()
+            timings, statuses = [], set()
+            for _ in range(options['requests']):
+                started = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - started) * 1000)
+                statuses.add(response.status_code)
+            timings.sort()
+            with CaptureQueriesContext(connection) as queries:
+                request()
+            # read now: the captured list is a view of a log the next request resets
+            query_count = len(queries)
+            tracemalloc.start()
+            request()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            row = {'p50_ms': round(percentile(timings, 50), 2), 'p95_ms': round(percentile(timings, 95), 2),
+                   'p99_ms': round(percentile(timings, 99), 2), 'queries': query_count,
+                   'peak_kb': round(peak / 1024, 1)}
+            if statuses != {scenario['status']}:
+                row['error'] = f'expected HTTP {scenario["status"]}, got {sorted(statuses)}'
+            rows[scenario['label']] = row
+            self.stdout.write(f'  {scenario["label"]:<28} {row["p50_ms"]:7.1f}ms {row["p95_ms"]:7.1f}ms '
+                              f'{row["p99_ms"]:7.1f}ms {row["queries"]:7} {row["peak_kb"]:8.0f}')
+        return rows
+
+    @staticmethod
+    def _fixture():
+        """Ids and cookies the scenarios need, picked from the seeded catalog."""
+        # the best sellers: full "bought together" lists and realistic carts
+        popular = list(OrderItem.objects.filter(product__isnull=False).values('product')
+                       .annotate(n=Count('id')).order_by('-n', 'product').values_list('product', flat=True)[:5])
+        popular = popular or list(Product.objects.order_by('id').values_list('id', flat=True)[:5])
+        # checkouts in the bench must never run out of stock
+        Product.objects.filter(pk__in=popular).update(stock=10 ** 6)
+        cart = Cart()
+        for product in Product.objects.filter(pk__in=popular).only('id', 'price'):
+            cart.add(product.id, price=product.price)
+        response = HttpResponse()
+        cart.save(response)
+        return {
+            'product_id': popular[0],
+            'cart_cookie': response.cookies[COOKIE_NAME].value,
+            'next_cursor': paginate(Product.objects.all()).next_cursor or '',
+        }
+
+
+def scenarios_for(fixture):
+    """One or more requests per URL name; every route must be covered."""
+    pid = fixture['product_id']
+
+    def uncached_search():
+        # results are cached per catalog version, so move it
+        bump_tags(PRODUCTS_TAG)
+
+    return [
+        {'route': 'home', 'label': 'home', 'method': 'get', 'path': reverse('home'), 'status': 200},
+        {'route': 'product_list', 'label': 'product_list', 'method': 'get', 'path': reverse('product_list'),
+         'status': 200},
+        {'route': 'product_list', 'label': 'product_list:category', 'method': 'get',
+         'path': reverse('product_list') + '?category=laptops', 'status': 200},
+        {'route': 'product_list', 'label': 'product_list:specs', 'method': 'get',
+         'path': reverse('product_list') + '?min_ram=16&min_storage=512', 'status': 200},
+        {'route': 'product_list', 'label': 'product_list:page2', 'method': 'get',
+         'path': reverse('product_list') + f'?cursor={fixture["next_cursor"]}', 'status': 200},
+        {'route': 'product_detail', 'label': 'product_detail', 'method': 'get',
+         'path': reverse('product_detail', args=[pid]), 'status': 200},
+        {'route': 'search', 'label': 'search', 'method': 'get', 'path': reverse('search') + '?q=thinkpad+16gb',
+         'before': uncached_search, 'status': 200},
+        {'route': 'search', 'label': 'search:broad', 'method': 'get', 'path': reverse('search') + '?q=laptop',
+         'before': uncached_search, 'status': 200},
+        {'route': 'api_suggest', 'label': 'api_suggest', 'method': 'get', 'path': reverse('api_suggest') + '?q=len',
+         'status': 200},
+        {'route': 'api_products', 'label': 'api_products', 'method': 'get', 'path': reverse('api_products'),
+         'status': 200},
+        {'route': 'api_product', 'label': 'api_product', 'method': 'get', 'path': reverse('api_product', args=[pid]),
+         'status': 200},
+        {'route': 'api_categories', 'label': 'api_categories', 'method': 'get', 'path': reverse('api_categories'),
+         'status': 200},
+        {'route': 'cart', 'label': 'cart', 'method': 'get', 'path': reverse('cart'), 'status': 200},
+        {'route': 'add_to_cart', 'label': 'add_to_cart', 'method': 'get', 'path': reverse('add_to_cart', args=[pid]),
+         'status': 302},
+        {'route': 'remove_from_cart', 'label': 'remove_from_cart', 'method': 'post',
+         'path': reverse('remove_from_cart', args=[pid]), 'status': 302},
+        {'route': 'place_order', 'label': 'place_order:checkout', 'method': 'get', 'path': reverse('place_order'),
+         'status': 200},
+        {'route': 'place_order', 'label': 'place_order:submit', 'method': 'post', 'path': reverse('place_order'),
+         'data': {'customer_name': 'Bench Customer', 'customer_email': 'bench@example.com'}, 'status': 200},
+        {'route': 'about', 'label': 'about', 'method': 'get', 'path': reverse('about'), 'status': 200},
+        {'route': 'contact', 'label': 'contact', 'method': 'get', 'path': reverse('contact'), 'status': 200},
+        {'route': 'contact', 'label': 'contact:submit', 'method': 'post', 'path': reverse('contact'),
+         'data': {'name': 'Bench Visitor', 'email': 'bench@example.com', 'message': 'A benchmark message.'},
+         'status': 200},
+        {'route': 'metrics', 'label': 'metrics', 'method': 'get', 'path': reverse('metrics'),
+         'headers': {'authorization': f'Bearer {METRICS_TOKEN}'}, 'status': 200},
+    ]
+
+
+def compare(baseline, results, tolerance, min_delta_ms):
+    """Regressions of ``results`` against ``baseline``, as messages.
+
+    Query counts are deterministic, so any increase fails. Latency (p95) and
+    peak memory fail when they grow by more than ``tolerance``; latency must
+    also grow by at least ``min_delta_ms``.
+    """
+    failures = []
+    for size, data in results['sizes'].items():
+        before = baseline.get('sizes', {}).get(size, {}).get('routes', {})
+        for label, row in data['routes'].items():
+            old = before.get(label)
+            if old is None:
+                continue
+            where = f'{size} products, {label}'
+            if row['queries'] > old['queries']:
+                failures.append(f'{where}: {row["queries"]} queries, baseline {old["queries"]}')
+            if (row['p95_ms'] > old['p95_ms'] * (1 + tolerance)
+                    and row['p95_ms'] - old['p95_ms'] >= min_delta_ms):
+                failures.append(f'{where}: p95 {row["p95_ms"]:.1f} ms, baseline {old["p95_ms"]:.1f} ms')
+            if row['peak_kb'] > old['peak_kb'] * (1 + tolerance) and row['peak_kb'] - old['peak_kb'] >= 64:
+                failures.append(f'{where}: peak {row["peak_kb"]:.0f} KB, baseline {old["peak_kb"]:.0f} KB')
+    return failures
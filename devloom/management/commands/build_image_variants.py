@@ -0,0 +1,119 @@
+from django.core.management.base import BaseCommand, CommandError
+import hashlib
+import json
+import os
+import re
+
+from devloom.cache import invalidate_catalog
+from devloom.images import (IMAGES_DIR, VARIANT_FORMATS, VARIANT_MANIFEST, VARIANT_WIDTHS,
+                            VARIANTS_DIR, list_image_files, static_path)
+
+# vector and animated images are served as-is
+RASTER_EXTENSIONS = ('png', 'jpg', 'jpeg', 'webp')
+SAVE_OPTIONS = {
+    'avif': {'quality': 60},
+    'webp': {'quality': 80, 'method': 6},
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+
+class Command(BaseCommand):
+    help = ('Write resized AVIF/WebP/JPEG copies of product images to images/variants/ and a '
+            'manifest used by the {% responsive_image %} tag. Unchanged images are skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--widths', default=','.join(map(str, VARIANT_WIDTHS)),
+                            help='Comma separated target widths in pixels')
+        parser.add_argument('--force', action='store_true', help='Rebuild variants even if the source is unchanged')
+
+    def handle(self, *args, **options):
+        try:
+            from PIL import Image, ImageOps, features
+        except ImportError:
+            raise CommandError('Pillow is required: pip install Pillow')
+
+        try:
+            widths = sorted({int(w) for w in options['widths'].split(',') if w.strip()})
+        except ValueError:
+            widths = None
+        if not widths or widths[0] <= 0:
+            raise CommandError('--widths takes comma separated positive integers, e.g. 320,640,1280')
+        formats = [fmt for fmt in VARIANT_FORMATS if fmt != 'avif' or features.check('avif')]
+        if 'avif' not in formats:
+            self.stdout.write(self.style.WARNING('This Pillow build cannot write AVIF; skipping that format.'))
+
+        os.makedirs(VARIANTS_DIR, exist_ok=True)
+        old_manifest = {}
+        if VARIANT_MANIFEST.exists():
+            old_manifest = json.loads(VARIANT_MANIFEST.read_text(encoding='utf-8'))
+
+        manifest = {}
+        built = skipped = 0
+        for fname in list_image_files(IMAGES_DIR):
+            if fname.split('.')[-1].lower() not in RASTER_EXTENSIONS:
+                continue
+            src = IMAGES_DIR / fname
+            with open(src, 'rb') as fh:
+                digest = hashlib.sha256(fh.read()).hexdigest()
+            key = static_path(fname)
+
+            previous = old_manifest.get(key)
+            if (not options['force'] and previous and previous.get('hash') == digest
+                    and self._variants_exist(previous)):
+                manifest[key] = previous
+                skipped += 1
+                continue
+
+            with Image.open(src) as img:
+                img = ImageOps.exif_transpose(img)
+                entry = {'hash': digest, 'width': img.width, 'height': img.height, 'variants': {}}
+                slug = re.sub(r'[^a-z0-9]+', '-', os.path.splitext(fname)[0].lower()).strip('-')
+                # never upscale; the widest copy is capped at the source width
+                targets = sorted({w for w in widths if w < img.width} | {min(img.width, widths[-1])})
+                for fmt in formats:
+                    entry['variants'][fmt] = []
+                    for width in targets:
+                        out = self._resize(img, width, fmt, Image)
+                        name = f'{slug}-{digest[:8]}-{width}.{"jpg" if fmt == "jpeg" else fmt}'
+                        out.save(VARIANTS_DIR / name, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+                        entry['variants'][fmt].append([width, f'{static_path("variants/")}{name}'])
+            manifest[key] = entry
+            built += 1
+            self.stdout.write(f'  {fname}: {len(targets)} widths x {len(formats)} formats')
+
+        # drop derivatives whose source is gone or changed
+        keep = {os.path.basename(path) for entry in manifest.values()
+                for variants in entry['variants'].values() for _, path in variants}
+        removed = 0
+        for name in os.listdir(VARIANTS_DIR):
+            if name != VARIANT_MANIFEST.name and name not in keep:
+                os.remove(VARIANTS_DIR / name)
+                removed += 1
+
+        VARIANT_MANIFEST.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding='utf-8')
+        if built or removed:
+            # cached cards and pages still carry the old <img> markup
+            invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS(
+            f'Built variants for {built} images, {skipped} unchanged, removed {removed} stale files.'))
+
+    @staticmethod
+    def _variants_exist(entry):
+        return all(
+            os.path.exists(VARIANTS_DIR / os.path.basename(path))
+            for variants in entry.get('variants', {}).values() for _, path in variants
+        )
+
+    @staticmethod
+    def _resize(img, width, fmt, Image):
+        height = max(1, round(img.height * width / img.width))
+        out = img.resize((width, height), Image.Resampling.LANCZOS)
+        if fmt == 'jpeg' and out.mode != 'RGB':
+            # flatten transparency onto white; JPEG has no alpha channel
+            rgba = out.convert('RGBA')
+            background = Image.new('RGB', rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            out = background
+        elif out.mode not in ('RGB', 'RGBA'):
+            out = out.convert('RGBA')
+        return out
@@ -0,0 +1,99 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Case, Count, Value, When
+
+from devloom.cache import invalidate_catalog
+from devloom.images import (IMAGES_DIR, NEAR_DUPLICATE_DISTANCE, SCAN_MANIFEST, duplicate_groups, hamming,
+                            load_scan_manifest, refresh_scan_manifest, save_scan_manifest, scan_image_files,
+                            static_path)
+from devloom.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Find product images that are byte-identical or look the same (perceptual hash), point every '
+            'product at one canonical file per group of identical files and, with --prune, delete the copies. '
+            'Look-alikes are only reported unless --merge-similar is given: the hash ignores colour.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-distance', type=int, default=NEAR_DUPLICATE_DISTANCE,
+                            help='Perceptual hash bits (of 64) that may differ for images reported as similar; '
+                                 '0 reports identical files only')
+        parser.add_argument('--apply', action='store_true', help='Repoint products at the canonical files')
+        parser.add_argument('--merge-similar', action='store_true',
+                            help='With --apply, also merge similar images, not just identical ones')
+        parser.add_argument('--prune', action='store_true', help='With --apply, also delete the duplicate files')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes used to hash files (default: one per CPU)')
+
+    def handle(self, *args, **options):
+        if options['prune'] and not options['apply']:
+            raise CommandError('--prune needs --apply')
+        files = scan_image_files(IMAGES_DIR)
+        manifest = load_scan_manifest(SCAN_MANIFEST)
+        hashed = refresh_scan_manifest(manifest, files, IMAGES_DIR, options['workers'])
+        identical = duplicate_groups(manifest)
+        groups = duplicate_groups(manifest, options['max_distance']) if options['max_distance'] > 0 else identical
+        if not groups:
+            save_scan_manifest(manifest, SCAN_MANIFEST)
+            self.stdout.write(self.style.SUCCESS(f'No duplicates among {len(files)} images ({len(hashed)} hashed).'))
+            return
+
+        paths = [static_path(f) for group in groups for f in group]
+        usage = dict(Product.objects.filter(image__in=paths).order_by()
+                     .values_list('image').annotate(n=Count('id')))
+
+        def rank(fname):
+            # the most pixels, then the plainest name ("x.png" over "x - Copy.png")
+            entry = manifest[fname]
+            return -((entry['width'] or 0) * (entry['height'] or 0)), len(fname), fname
+
+        # a red and a navy shot of one product hash alike, since dhash works in
+        # greyscale: only byte-identical files are merged unless asked
+        repoint = {}
+        for group in (groups if options['merge_similar'] else identical):
+            canonical, *copies = sorted(group, key=rank)
+            repoint.update((fname, canonical) for fname in copies)
+
+        similar = 0
+        self.stdout.write(f'\n{len(groups)} groups of duplicate images:')
+        for group in sorted(groups, key=lambda g: min(g)):
+            canonical, *copies = sorted(group, key=rank)
+            self.stdout.write(f'  {canonical} ({usage.get(static_path(canonical), 0)} products)')
+            for fname in copies:
+                entry = manifest[fname]
+                same = entry['sha256'] == manifest[canonical]['sha256']
+                how = 'identical' if same else f"{hamming(entry['dhash'], manifest[canonical]['dhash'])} bits apart"
+                if fname not in repoint:
+                    similar += 1
+                    how += ', kept'
+                elif repoint[fname] != canonical:
+                    how += f', identical to {repoint[fname]}'
+                self.stdout.write(f'    {fname}: {how}, {entry["size"] // 1024} KB, '
+                                  f'{usage.get(static_path(fname), 0)} products')
+        reclaimable = sum(manifest[fname]['size'] for fname in repoint)
+        self.stdout.write(f'{len(repoint)} copies, {reclaimable // 1024} KB reclaimable.')
+        if similar:
+            self.stdout.write(self.style.WARNING(
+                f'{similar} similar but not identical images are kept; check them, then pass '
+                f'--merge-similar to merge them too.'))
+
+        if not options['apply']:
+            save_scan_manifest(manifest, SCAN_MANIFEST)
+            self.stdout.write(self.style.SUCCESS('\nRun with --apply to point products at the canonical files.'))
+            return
+
+        # one UPDATE for every copy in use
+        moved = Product.objects.filter(image__in=[static_path(f) for f in repoint]).update(image=Case(
+            *(When(image=static_path(copy), then=Value(static_path(canonical)))
+              for copy, canonical in repoint.items())))
+        if moved:
+            # queryset.update() skips the signals that drop cached pages and cards
+            invalidate_catalog()
+        for copy, canonical in repoint.items():
+            manifest[copy]['duplicate_of'] = canonical
+            manifest[copy].pop('product', None)
+            if options['prune']:
+                (IMAGES_DIR / copy).unlink(missing_ok=True)
+                del manifest[copy]
+        save_scan_manifest(manifest, SCAN_MANIFEST)
+        self.stdout.write(self.style.SUCCESS(
+            f'Repointed {moved} products' + (f' and deleted {len(repoint)} files.' if options['prune'] else '.')))
@@ -1,136 +1,77 @@
+from collections import deque
 from django.core.management.base import BaseCommand
-from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 import os
 import re
+
+from devloom import recommendations
+from devloom.cache import invalidate_catalog
+from devloom.images import (IMAGES_DIR, SCAN_MANIFEST, infer_category, load_scan_manifest, refresh_scan_manifest,
+                            save_scan_manifest, scan_image_files, static_path)
 from devloom.models import Product, Category
 
+# ignore obvious non-product images
+IGNORE_PATTERNS = [r'devloom_logo', r'logo', r'online shopping', r'hero', r'background']
+
 
 class Command(BaseCommand):
-    help = 'Ensure every product image file has a Product; create products as needed and assign images. Use --preview first.'
+    help = ('Ensure every product image file has a Product; create products as needed and assign images. '
+            'Only files that are new or changed since the last --apply are looked at. Use --preview first.')
 
     def add_arguments(self, parser):
         parser.add_argument('--preview', action='store_true', help='Show planned creations/assignments without saving')
         parser.add_argument('--apply', action='store_true', help='Apply planned creations/assignments')
+        parser.add_argument('--rescan', action='store_true', help='Ignore the manifest and look at every file again')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes used to hash files (default: one per CPU)')
 
     def handle(self, *args, **options):
         preview = options.get('preview', False)
         apply = options.get('apply', False)
-        images_dir = os.path.join(settings.BASE_DIR, 'devloom', 'static', 'devloom', 'images')
-        if not os.path.isdir(images_dir):
-            self.stdout.write(self.style.ERROR(f'Images directory not found: {images_dir}'))
+        if not IMAGES_DIR.is_dir():
+            self.stdout.write(self.style.ERROR(f'Images directory not found: {IMAGES_DIR}'))
             return
 
-        files = [f for f in os.listdir(images_dir)
-                 if os.path.isfile(os.path.join(images_dir, f)) and f.split('.')[-1].lower() in ('png', 'jpg', 'jpeg', 'webp', 'gif', 'svg')]
-
-        # ignore obvious non-product images
-        ignore_patterns = [r'devloom_logo', r'logo', r'online shopping', r'hero', r'background']
-
-        product_files = []
-        for f in files:
-            fn = f.lower()
-            if any(re.search(pat, fn) for pat in ignore_patterns):
-                continue
-            product_files.append(f)
-
-        if not product_files:
-            self.stdout.write(self.style.WARNING('No candidate product images found.'))
+        files = scan_image_files(IMAGES_DIR)
+        manifest = {} if options['rescan'] else load_scan_manifest(SCAN_MANIFEST)
+        gone = {f: entry for f, entry in manifest.items() if f not in files}
+        # only new files and files whose content changed are hashed
+        refresh_scan_manifest(manifest, files, IMAGES_DIR, options['workers'])
+        product_files = [f for f in sorted(files) if not any(re.search(pat, f.lower()) for pat in IGNORE_PATTERNS)]
+        pending = [f for f in product_files if not {'product', 'duplicate_of'} & manifest[f].keys()]
+        if not pending and not gone:
+            save_scan_manifest(manifest, SCAN_MANIFEST)
+            self.stdout.write(self.style.SUCCESS(f'All {len(product_files)} product images are up to date.'))
             return
 
-        # keyword map for categories
-        keyword_map = {
-            'laptop': 'Laptops', 'notebook': 'Laptops', 'macbook': 'Laptops',
-            'desktop': 'Desktops', 'tower': 'Desktops', 'workstation': 'Desktops',
-            'accessory': 'Accessories', 'accessories': 'Accessories', 'mouse': 'Accessories', 'keyboard': 'Accessories', 'bag': 'Accessories', 'charger': 'Accessories'
-        }
-
-        categories = {c.name.lower(): c for c in Category.objects.all()}
-        default_category = None
-        if 'laptops' in categories:
-            default_category = categories['laptops']
-        else:
-            # pick any category
-            default_category = next(iter(categories.values())) if categories else None
-
-        planned = []  # tuples: (filename, existing_product_or_none, create_flag, target_category)
-        reserved_product_ids = set()
-
-        # existing images mapping
-        existing_images = {p.image: p for p in Product.objects.exclude(image__isnull=True).exclude(image__exact='')}
-
-        for fname in product_files:
-            relpath = f'devloom/images/{fname}'
-            if relpath in existing_images:
-                # already assigned
-                planned.append((fname, existing_images[relpath], False, None))
-                continue
-
-            # infer category
-            fn = fname.lower()
-            inferred = None
-            for kw, cname in keyword_map.items():
-                if kw in fn:
-                    inferred = categories.get(cname.lower())
-                    if inferred:
-                        break
-            if not inferred:
-                # fallback: try to find category name in filename
-                for cname, cobj in categories.items():
-                    if cname in fn:
-                        inferred = cobj
-                        break
-            if not inferred:
-                inferred = default_category
-
-            # find a product in that category without an image
-            target_product = None
-            if inferred:
-                for p in inferred.products.all():
-                    if not p.image:
-                        target_product = p
-                        break
-
-            if target_product:
-                # reserve this product so we don't reuse it for multiple files
-                if target_product.id in reserved_product_ids:
-                    # try to find another product in the category not yet reserved
-                    next_prod = None
-                    for p in inferred.products.all():
-                        if not p.image and p.id not in reserved_product_ids:
-                            next_prod = p
-                            break
-                    if next_prod:
-                        target_product = next_prod
-                    else:
-                        # no available product, mark to create a new one
-                        target_product = None
-
-                if target_product:
-                    reserved_product_ids.add(target_product.id)
-                    planned.append((fname, target_product, False, inferred))
-                else:
-                    planned.append((fname, None, True, inferred))
-            else:
-                # will create a new product
-                planned.append((fname, None, True, inferred))
+        planned = self._plan(pending, manifest, gone)
 
         # report preview
-        self.stdout.write('\nPlanned assignments:')
-        creates = 0
-        assigns = 0
-        for fname, prod, will_create, cat in planned:
-            if prod and not will_create:
-                self.stdout.write(f'  {fname} -> existing {prod.category.name} / {prod.name}')
-                assigns += 1
-            elif will_create:
-                cname = cat.name if cat else 'UNSPECIFIED'
-                self.stdout.write(f'  {fname} -> will CREATE product in {cname}')
+        self.stdout.write(f'\n{len(pending)} new or changed files, {len(product_files) - len(pending)} unchanged:')
+        creates = assigns = missing = 0
+        for fname, action, target in planned:
+            if action == 'create':
+                self.stdout.write(f'  {fname} -> will CREATE product in {target.name if target else "UNSPECIFIED"}')
                 creates += 1
-            else:
-                self.stdout.write(f'  {fname} -> assign to {prod.category.name} / {prod.name}')
+            elif action == 'assign':
+                self.stdout.write(f'  {fname} -> assign to {target.name}')
                 assigns += 1
+            elif action == 'rename':
+                self.stdout.write(f'  {fname} -> renamed file of {target.name}')
+                assigns += 1
+            elif action == 'duplicate':
+                self.stdout.write(f'  {fname} -> same image as {target}; no new product')
+            elif action == 'missing':
+                self.stdout.write(f'  {fname} -> file is gone; {target.name} will have no image')
+                missing += 1
+            else:
+                self.stdout.write(f'  {fname} -> existing {target.name}')
 
         self.stdout.write(self.style.SUCCESS(f'Preview: {creates} products will be created, {assigns} assignments to existing products.'))
+        if missing:
+            self.stdout.write(self.style.WARNING(
+                f'{missing} products point at image files that are gone; --apply clears their image.'))
 
         if preview and not apply:
             self.stdout.write(self.style.SUCCESS('\nRun with --apply to perform these changes.'))
@@ -140,35 +81,124 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING('No --apply flag provided; nothing was changed. Use --apply to apply.'))
             return
 
-        # Apply creations and assignments
-        created_count = 0
-        assigned_count = 0
-        for fname, prod, will_create, cat in planned:
-            rel = f'devloom/images/{fname}'
-            if prod and not will_create:
-                prod.image = rel
-                prod.save()
-                assigned_count += 1
+        created_count, assigned_count, cleared_count = self._apply(planned, manifest)
+        save_scan_manifest(manifest, SCAN_MANIFEST)
+        self.stdout.write(self.style.SUCCESS(
+            f'Applied: created {created_count} products and assigned images to {assigned_count} existing ones.'))
+        if cleared_count:
+            self.stdout.write(self.style.WARNING(
+                f'Cleared the image of {cleared_count} products whose file is gone; they wait for a new one.'))
+
+    def _plan(self, pending, manifest, gone):
+        """``[(fname, action, target)]`` for the files not handled yet.
+
+        ``action`` is 'existing' or 'rename' (target: the Product), 'assign'
+        (target: a Product without an image), 'create' (target: its Category)
+        or 'duplicate' (target: the file with the same bytes, whose product
+        the copy shares instead of getting one). Vanished files that are not
+        renamed come last as 'missing' (target: the Product still showing it).
+        """
+        categories = {c.name.lower(): c for c in Category.objects.all()}
+        by_id = {c.pk: c for c in categories.values()}
+        default_category = categories.get('laptops') or next(iter(categories.values()), None)
+
+        paths = [static_path(f) for f in pending] + [static_path(f) for f in gone]
+        with_image = {}
+        for i in range(0, len(paths), 500):
+            with_image.update((p.image, p) for p in Product.objects.filter(image__in=paths[i:i + 500])
+                              .only('id', 'name', 'image'))
+        # vanished files by content, so a renamed file keeps its product
+        moved = {entry.get('sha256'): f for f, entry in gone.items() if static_path(f) in with_image}
+        # handled files by content, so a byte-identical copy adds no product
+        known = {entry['sha256']: f for f, entry in sorted(manifest.items(), reverse=True)
+                 if 'product' in entry}
+        waiting = {}  # category id -> imageless product ids, lowest first
+        # read off the partial devloom_product_no_image index
+        for pk, category_id in (Product.objects.filter(Q(image__isnull=True) | Q(image=''))
+                                .order_by('category_id', 'id').values_list('id', 'category_id')):
+            waiting.setdefault(category_id, deque()).append(pk)
+        category_ids = {name: c.pk for name, c in categories.items()}
+
+        planned, renamed = [], set()
+        for fname in pending:
+            sha256 = manifest[fname]['sha256']
+            relpath = static_path(fname)
+            if relpath in with_image:
+                # already assigned
+                planned.append((fname, 'existing', with_image[relpath]))
+            elif sha256 in moved:
+                old = moved.pop(sha256)
+                renamed.add(old)
+                planned.append((fname, 'rename', with_image[static_path(old)]))
+            elif sha256 in known:
+                planned.append((fname, 'duplicate', known[sha256]))
                 continue
-            if will_create:
+            else:
+                # infer category
+                fn = fname.lower()
+                inferred = by_id.get(infer_category(fname, category_ids))
+                if not inferred:
+                    # fallback: try to find category name in filename
+                    inferred = next((c for name, c in categories.items() if name in fn), default_category)
+
+                # the next product in that category without an image, each used once
+                queue = waiting.get(inferred.pk) if inferred else None
+                if queue:
+                    planned.append((fname, 'assign', queue.popleft()))
+                else:
+                    planned.append((fname, 'create', inferred))
+            known.setdefault(sha256, fname)
+        planned += [(f, 'missing', with_image[static_path(f)]) for f in sorted(gone)
+                    if static_path(f) in with_image and f not in renamed]
+
+        products = Product.objects.only('id', 'name', 'image').in_bulk(
+            [pk for _, action, pk in planned if action == 'assign'])
+        return [(f, action, products[t] if action == 'assign' else t) for f, action, t in planned]
+
+    def _apply(self, planned, manifest):
+        """Write the plan in one transaction; returns ``(created, assigned, cleared)``."""
+        default_category = None
+        to_update, to_create, to_clear = [], [], []
+        for fname, action, target in planned:
+            rel = static_path(fname)
+            if action in ('assign', 'rename'):
+                target.image = rel
+                to_update.append((fname, target))
+            elif action == 'create':
                 # create a product using filename
                 base = os.path.splitext(fname)[0]
                 # sanitize name
-                name = re.sub(r'[_\-]+', ' ', base).strip()
-                if not name:
-                    name = 'Product'
+                name = re.sub(r'[_\-]+', ' ', base).strip() or 'Product'
                 # ensure category
-                if not cat:
-                    cat = default_category
-                # create product
-                newp = Product.objects.create(
-                    category=cat,
+                if not target:
+                    default_category = default_category or Category.objects.get_or_create(name='Laptops')[0]
+                    target = default_category
+                to_create.append((fname, Product(
+                    category=target,
                     name=name,
                     description='Imported product image',
                     price=0.00,
                     stock=10,
-                    image=rel
-                )
-                created_count += 1
-
-        self.stdout.write(self.style.SUCCESS(f'Applied: created {created_count} products and assigned images where applicable.'))
+                    image=rel,
+                )))
+            elif action == 'duplicate':
+                manifest[fname]['duplicate_of'] = target
+            elif action == 'missing':
+                # imageless again, so the next matching file is assigned to it
+                target.image = None
+                to_clear.append(target)
+            else:
+                manifest[fname]['product'] = target.pk
+
+        with transaction.atomic():
+            Product.objects.bulk_update([p for _, p in to_update] + to_clear, ['image'], batch_size=1000)
+            Product.objects.bulk_create([p for _, p in to_create], batch_size=1000)
+        for fname, product in to_update + to_create:
+            manifest[fname]['product'] = product.pk
+
+        if to_update or to_create or to_clear:
+            # bulk writes skip the signals behind counts and cached pages
+            Category.refresh_product_counts()
+            invalidate_catalog()
+            recommendations.discard_candidate_pool()
+        return len(to_create), len(to_update), len(to_clear)
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from devloom.catalog_io import FORMATS, detect_format, export_rows, write_rows
+from devloom.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Write every product to CSV or JSON Lines, streaming from the database. '
+            'The output can be fed back to import_catalog.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('-o', '--output', default='-', help="File to write, or '-' for stdout (default)")
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the output extension, else csv')
+        parser.add_argument('--category', help='Only export products in this category (by name)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per query')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = detect_format(output if output != '-' else '', options['format'])
+        products = Product.objects.all()
+        if options['category']:
+            products = products.filter(category__name=options['category'])
+        rows = export_rows(products, chunk_size=options['chunk_size'])
+
+        if output == '-':
+            write_rows(self.stdout, rows, fmt)
+            return
+        try:
+            with open(output, 'w', newline='', encoding='utf-8') as stream:
+                count = write_rows(stream, rows, fmt)
+        except OSError as exc:
+            raise CommandError(f'Cannot write {output}: {exc}')
+        self.stdout.write(self.style.SUCCESS(f'Exported {count} products to {output}.'))
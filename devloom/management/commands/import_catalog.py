@@ -0,0 +1,42 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from devloom.catalog_io import DEFAULT_BATCH_SIZE, FORMATS, detect_format, import_rows, read_rows
+
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = ('Create or update products from a CSV or JSON Lines file, matched on sku. '
+            'Columns: sku, name, category, price, stock, description, image.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or '-' for stdin")
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension (csv unless .jsonl)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Rows per transaction')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = detect_format(path, options['format'])
+        started = time.monotonic()
+        if path == '-':
+            stats = import_rows(read_rows(sys.stdin, fmt), batch_size=options['batch_size'])
+        else:
+            try:
+                # utf-8-sig: spreadsheets often save CSV with a byte order mark
+                with open(path, newline='', encoding='utf-8-sig') as stream:
+                    stats = import_rows(read_rows(stream, fmt), batch_size=options['batch_size'])
+            except OSError as exc:
+                raise CommandError(f'Cannot read {path}: {exc}')
+
+        for error in stats.errors[:MAX_REPORTED_ERRORS]:
+            self.stderr.write(f'Skipped {error}')
+        if len(stats.errors) > MAX_REPORTED_ERRORS:
+            self.stderr.write(f'... and {len(stats.errors) - MAX_REPORTED_ERRORS} more')
+        style = self.style.WARNING if stats.errors else self.style.SUCCESS
+        self.stdout.write(style(
+            f'Created {stats.created}, updated {stats.updated}, unchanged {stats.unchanged}, '
+            f'skipped {len(stats.errors)} products in {time.monotonic() - started:.1f}s.'))
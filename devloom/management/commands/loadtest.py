@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+import asyncio
+from urllib.parse import quote
+
+from devloom.benchmarks import http_load, percentile
+from devloom.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = ('Load test a running server (e.g. gunicorn on Website.wsgi or uvicorn on Website.asgi): '
+            'requests/sec and latency percentiles per route. Product and category ids are read from the '
+            'configured database, so point the server at the same one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', nargs='?', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=32, help='Open connections')
+        parser.add_argument('--seconds', type=float, default=10.0)
+        parser.add_argument('--path', action='append', dest='paths', metavar='PATH',
+                            help='Route to request (repeatable); default: the catalog, cart and API routes')
+        parser.add_argument('--bust-cache', action='store_true',
+                            help='Add a unique query string to every page so the page cache never answers')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or self._default_paths()
+        self.stdout.write(f'{options["url"]}: {len(paths)} routes, {options["concurrency"]} connections, '
+                          f'{options["seconds"]:.0f}s')
+        results = asyncio.run(http_load(options['url'], paths, options['concurrency'], options['seconds'],
+                                        bust_cache=options['bust_cache']))
+
+        seconds = options['seconds']
+        every, failed = [], []
+        self.stdout.write(f'\n{"route":<40} {"req/s":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"max":>8}  errors')
+        for path, (timings, errors) in results.items():
+            timings.sort()
+            every.extend(timings)
+            failed.extend(errors)
+            self.stdout.write(self._row(path, timings, seconds, errors))
+        every.sort()
+        self.stdout.write(self._row('all', every, seconds, failed))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{len(failed)} requests failed, e.g. {failed[0]}'))
+        if not every:
+            raise CommandError(f'No request to {options["url"]} succeeded.')
+
+    @staticmethod
+    def _row(label, timings, seconds, errors):
+        return (f'{label[:40]:<40} {len(timings) / seconds:8.0f} {percentile(timings, 50):6.1f}ms '
+                f'{percentile(timings, 95):6.1f}ms {percentile(timings, 99):6.1f}ms '
+                f'{timings[-1] if timings else 0:6.1f}ms  {len(errors)}')
+
+    @staticmethod
+    def _default_paths():
+        category = Category.objects.order_by('-product_count').values_list('name', flat=True).first()
+        product_id = Product.objects.order_by('-created_at', '-id').values_list('id', flat=True).first()
+        if product_id is None:
+            raise CommandError('The catalog is empty; run seed_devloom first or pass --path.')
+        return [
+            '/products/',
+            f'/products/?category={quote(category or "")}',
+            f'/products/{product_id}/',
+            '/cart/',
+            '/api/v1/products/',
+            f'/api/v1/products/{product_id}/',
+            '/api/v1/categories/',
+        ]
+
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from devloom.recommendations import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the "frequently bought together" index from all OrderItem history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Order items fetched per database round trip')
+
+    def handle(self, *args, **options):
+        written = rebuild_index(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt co-purchase index for {written} products.'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from devloom.cache import invalidate_catalog
+from devloom.search import optimize_index
+
+
+class Command(BaseCommand):
+    help = ('Merge the product search index into one segment (run after bulk imports), '
+            'or rebuild it from the product table with --rebuild. SQLite only.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Re-read every product instead of merging')
+
+    def handle(self, *args, **options):
+        if not optimize_index(rebuild=options['rebuild']):
+            self.stdout.write(self.style.WARNING('No FTS index on this database; search scans the product table.'))
+            return
+        invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.' if options['rebuild'] else 'Search index optimized.'))
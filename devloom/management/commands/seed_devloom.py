@@ -1,8 +1,35 @@
 from django.core.management.base import BaseCommand
-from devloom.models import Category, Product
+from django.db import transaction
+from itertools import accumulate
+import random
+
+from devloom import recommendations
+from devloom.cache import invalidate_catalog
+from devloom.models import Category, Order, OrderItem, Product
+from devloom.search import optimize_index
+from devloom.specs import extract_specs
+
+# synthetic catalog: category -> (share of products, model names, price range in Ksh)
+SYNTHETIC = {
+    "Laptops": (0.45, ["Lenovo ThinkPad", "HP EliteBook", "Dell Latitude", "ASUS ZenBook", "Acer Swift",
+                       "MacBook Pro", "MSI Modern"], (35000, 320000)),
+    "Desktops": (0.25, ["Dell OptiPlex", "HP ProDesk", "Lenovo ThinkCentre", "ASUS ROG Strix",
+                        "Acer Veriton"], (30000, 280000)),
+    "Accessories": (0.30, ["Logitech MX Mouse", "Keychron Keyboard", "Anker USB-C Hub", "Dell Docking Station",
+                           "Samsung Monitor", "HDMI Cable", "Laptop Sleeve"], (500, 45000)),
+}
+# items per order, drawn uniformly: most orders hold one or two products
+ORDER_SIZES = (1, 1, 1, 2, 2, 3, 4)
+BATCH_SIZE = 5000
 
 class Command(BaseCommand):
-    help = "Seed the devloom app with sample categories and products"
+    help = ("Seed the devloom app with sample categories and products. --products and --orders top the "
+            "catalog and order history up to a size with reproducible synthetic data (for benchmarks).")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=0, help="Add synthetic products up to this many in total")
+        parser.add_argument("--orders", type=int, default=0, help="Add synthetic orders up to this many in total")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data")
 
     def handle(self, *args, **options):
         categories = [
@@ -28,3 +55,76 @@ class Command(BaseCommand):
                     created += 1
 
         self.stdout.write(self.style.SUCCESS(f"Seed complete — created {created} products (if missing)."))
+
+        # the same seed and sizes always give the same catalog
+        rng = random.Random(options["seed"])
+        added_products = self._add_products(rng, options["products"] - Product.objects.count())
+        added_orders = self._add_orders(rng, options["orders"] - Order.objects.count())
+        if added_products or added_orders:
+            self.stdout.write(self.style.SUCCESS(
+                f"Added {added_products} synthetic products and {added_orders} orders."))
+
+    @staticmethod
+    def _add_products(rng, count):
+        if count <= 0:
+            return 0
+        by_name = {c.name: c for c in Category.objects.filter(name__in=SYNTHETIC)}
+        names = list(SYNTHETIC)
+        shares = [SYNTHETIC[name][0] for name in names]
+        for start in range(0, count, BATCH_SIZE):
+            batch = []
+            for _ in range(min(BATCH_SIZE, count - start)):
+                category = rng.choices(names, shares)[0]
+                _, models, (low, high) = SYNTHETIC[category]
+                model = f"{rng.choice(models)} {rng.randint(100, 999)} G{rng.randint(1, 9)}"
+                if category == "Accessories":
+                    description = f"{model}: a dependable everyday accessory for the office and home."
+                else:
+                    description = (f"{model} with {rng.choice((8, 16, 16, 32, 64))}GB RAM, "
+                                   f"{rng.choice((256, 512, 512, 1024, 2048))}GB SSD and a "
+                                   f"{rng.choice(('Core i5', 'Core i7', 'Ryzen 5', 'Ryzen 7', 'M3'))} processor.")
+                # bulk_create skips Product.save(), which parses the specs
+                ram_gb, storage_gb = extract_specs(description)
+                batch.append(Product(category=by_name[category], name=model, description=description,
+                                     price=rng.randrange(low, high, 50), stock=rng.randint(0, 60),
+                                     ram_gb=ram_gb, storage_gb=storage_gb))
+            with transaction.atomic():
+                Product.objects.bulk_create(batch)
+        # bulk writes skip the signals behind counts and cached pages
+        Category.refresh_product_counts()
+        invalidate_catalog()
+        recommendations.discard_candidate_pool()
+        optimize_index()
+        return count
+
+    @staticmethod
+    def _add_orders(rng, count):
+        """Orders over a long-tailed popularity curve, like real shoppers."""
+        if count <= 0:
+            return 0
+        products = list(Product.objects.order_by("id").values_list("id", "name", "price"))
+        if not products:
+            return 0
+        rng.shuffle(products)
+        # Zipf-like: the k-th most popular product is picked about k^-0.9 as often as the first
+        weights = list(accumulate(1 / rank ** 0.9 for rank in range(1, len(products) + 1)))
+        for start in range(0, count, BATCH_SIZE):
+            size = min(BATCH_SIZE, count - start)
+            with transaction.atomic():
+                orders = Order.objects.bulk_create([
+                    Order(customer_name=f"Customer {rng.randint(1, 10 ** 6)}",
+                          customer_email=f"customer{rng.randint(1, 10 ** 6)}@example.com")
+                    for _ in range(size)
+                ])
+                items = []
+                for order in orders:
+                    wanted = min(rng.choice(ORDER_SIZES), len(products))
+                    picked = {}
+                    while len(picked) < wanted:
+                        pid, name, price = rng.choices(products, cum_weights=weights)[0]
+                        picked[pid] = OrderItem(order=order, product_id=pid, name=name, price=price,
+                                                quantity=rng.choice((1, 1, 1, 2)))
+                    items.extend(picked.values())
+                OrderItem.objects.bulk_create(items, batch_size=BATCH_SIZE)
+        recommendations.rebuild_index()
+        return count
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+import time
+
+from devloom.outbox import deliver_pending
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbound email over one reused connection. Use --loop to keep running as a worker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Messages claimed per round trip')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox instead of exiting')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = deliver_pending(batch_size=options['batch_size'])
+            if sent or failed or not options['loop']:
+                style = self.style.WARNING if failed else self.style.SUCCESS
+                self.stdout.write(style(f'Sent {sent} emails, {failed} failed (will retry with backoff).'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,270 @@
+"""Per-view request metrics: latency, queries, template time, response size.
+
+:class:`MetricsMiddleware` records every request into in-process histograms
+labelled with the URL name (``product_list``, ``cart``, ``api_products``...).
+:func:`metrics_view` serves them at ``/metrics`` in the Prometheus text
+format to scrapers that present DEVLOOM_METRICS_TOKEN, and every response
+carries a ``Server-Timing`` header.
+
+Timing a request and measuring its body costs two clock reads and a locked
+dict update. Query and template timing, and the SQL logged for slow requests,
+are collected only for the sampled fraction of requests
+(DEVLOOM_METRICS_SAMPLE_RATE, off by default). For the rest, the query hook
+and the template backend read one context variable and get out of the way.
+
+The numbers are per worker process: scrape each worker, or run one, to see
+them all.
+"""
+import bisect
+import heapq
+import hmac
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = getattr(settings, 'DEVLOOM_METRICS_SAMPLE_RATE', 0.0)
+SLOW_REQUEST_MS = getattr(settings, 'DEVLOOM_SLOW_REQUEST_MS', 1000)
+# statements quoted when a sampled request is slow
+SLOW_SQL_LIMIT = 10
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+# name -> (help, bucket bounds)
+HISTOGRAMS = {
+    'devloom_request_duration_seconds': ('Time spent handling the request, middleware included', SECONDS_BUCKETS),
+    'devloom_response_size_bytes': ('Response body size (streaming responses are not counted)', BYTES_BUCKETS),
+    'devloom_db_queries': ('Database queries per sampled request', QUERY_BUCKETS),
+    'devloom_db_duration_seconds': ('Time spent in database queries per sampled request', SECONDS_BUCKETS),
+    'devloom_template_duration_seconds': ('Template render time per sampled request, including queries '
+                                          'run from templates', SECONDS_BUCKETS),
+}
+
+
+class Histogram:
+    """One series: counts per bucket (the last one is +Inf), sum and count."""
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class Registry:
+    """Thread-safe store of every series, keyed by metric and view."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}  # (metric, view) -> Histogram
+            self.responses = {}  # (view, status) -> count
+
+    def observe(self, view, status, values):
+        with self.lock:
+            self.responses[view, status] = self.responses.get((view, status), 0) + 1
+            for metric, value in values.items():
+                histogram = self.histograms.get((metric, view))
+                if histogram is None:
+                    histogram = self.histograms[metric, view] = Histogram(HISTOGRAMS[metric][1])
+                histogram.observe(value)
+
+    def get(self, metric, view):
+        return self.histograms.get((metric, view))
+
+    def render(self):
+        """The Prometheus text exposition format (version 0.0.4)."""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            responses = sorted(self.responses.items())
+        lines = ['# HELP devloom_responses_total Responses by view and status code',
+                 '# TYPE devloom_responses_total counter']
+        lines += [f'devloom_responses_total{{view="{_label(view)}",status="{status}"}} {count}'
+                  for (view, status), count in responses]
+        described = set()
+        for (metric, view), histogram in histograms:
+            if metric not in described:
+                described.add(metric)
+                lines += [f'# HELP {metric} {HISTOGRAMS[metric][0]}', f'# TYPE {metric} histogram']
+            view = _label(view)
+            cumulative = 0
+            for bound, count in zip((*histogram.bounds, '+Inf'), histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{view="{view}"}} {histogram.sum:.6g}')
+            lines.append(f'{metric}_count{{view="{view}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+# --- per-request collection (sampled requests only) ---
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'template_time', 'slowest')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.slowest = []  # min-heap of (seconds, sql), at most SLOW_SQL_LIMIT
+
+
+# follows the request across sync_to_async/async_to_sync hops
+_current = ContextVar('devloom_request_stats', default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper that times queries of sampled requests."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        stats.db_time += elapsed
+        if len(stats.slowest) < SLOW_SQL_LIMIT:
+            heapq.heappush(stats.slowest, (elapsed, sql))
+        else:
+            heapq.heappushpop(stats.slowest, (elapsed, sql))
+
+
+def install_query_hook(sender, connection, **kwargs):
+    """``connection_created`` receiver: put :func:`time_query` on every connection.
+
+    It goes first, so a ``connection.execute_wrapper()`` block that opened the
+    connection still pops its own wrapper on exit.
+    """
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The stock Django template backend, timing renders of sampled requests."""
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+# --- middleware and endpoint ---
+
+class MetricsMiddleware:
+    """Record each request into :data:`registry`; list it first in MIDDLEWARE."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats() if SAMPLE_RATE and random.random() < SAMPLE_RATE else None
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, time.perf_counter() - started, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats() if SAMPLE_RATE and random.random() < SAMPLE_RATE else None
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, time.perf_counter() - started, stats)
+
+    def finish(self, request, response, elapsed, stats):
+        match = request.resolver_match
+        # unresolved paths share one label, so scanners cannot grow the registry
+        view = match.view_name if match else 'unmatched'
+        values = {'devloom_request_duration_seconds': elapsed}
+        if not response.streaming:
+            values['devloom_response_size_bytes'] = len(response.content)
+        timing = [f'total;dur={elapsed * 1000:.1f}']
+        if stats is not None:
+            values.update(devloom_db_queries=stats.queries, devloom_db_duration_seconds=stats.db_time,
+                          devloom_template_duration_seconds=stats.template_time)
+            timing += [f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"',
+                       f'tpl;dur={stats.template_time * 1000:.1f}']
+        registry.observe(view, response.status_code, values)
+        response['Server-Timing'] = ', '.join(timing)
+        if elapsed * 1000 >= SLOW_REQUEST_MS:
+            self.log_slow(request, view, response, elapsed, stats)
+        return response
+
+    @staticmethod
+    def log_slow(request, view, response, elapsed, stats):
+        if stats is None:
+            detail = ' (not sampled, no SQL recorded)'
+        else:
+            detail = (f', {stats.queries} queries in {stats.db_time * 1000:.0f} ms, '
+                      f'templates {stats.template_time * 1000:.0f} ms; slowest SQL:')
+            detail += ''.join(f'\n  {seconds * 1000:8.1f} ms  {sql}'
+                              for seconds, sql in sorted(stats.slowest, reverse=True))
+        logger.warning('Slow request %s %s (%s): %.0f ms, status %s%s', request.method,
+                       request.get_full_path(), view, elapsed * 1000, response.status_code, detail)
+
+
+def metrics_view(request):
+    """``/metrics``: this process's histograms for Prometheus.
+
+    Requires ``Authorization: Bearer <DEVLOOM_METRICS_TOKEN>``. The client
+    address proves nothing here: behind a local reverse proxy every request
+    comes from 127.0.0.1.
+    """
+    token = getattr(settings, 'DEVLOOM_METRICS_TOKEN', '')
+    supplied = request.headers.get('Authorization', '').encode()
+    if not token or not hmac.compare_digest(supplied, f'Bearer {token}'.encode()):
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
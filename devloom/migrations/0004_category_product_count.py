@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:42
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_product_counts(apps, schema_editor):
+    Category = apps.get_model('devloom', 'Category')
+    for category in Category.objects.annotate(n=Count('products')):
+        Category.objects.filter(pk=category.pk).update(product_count=category.n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devloom', '0003_order_orderitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_product_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devloom', '0004_category_product_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='ram_gb',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='storage_gb',
+            field=models.PositiveIntegerField(blank=True, db_index=True, help_text='SSD size in GB (1 TB = 1024)', null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def install_index(apps, schema_editor):
+    from devloom.search import install_index
+
+    install_index(schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    from devloom.search import drop_index
+
+    drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    """FTS5 product index for devloom.search (SQLite only; a no-op elsewhere)."""
+
+    dependencies = [
+        ('devloom', '0007_outboundemail'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_index, drop_index),
+    ]
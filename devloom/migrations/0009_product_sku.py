@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat, LPad
+
+import devloom.models
+
+
+def fill_skus(apps, schema_editor):
+    Product = apps.get_model('devloom', 'Product')
+    Product.objects.update(sku=Concat(Value('DL-'), LPad(Cast('id', CharField()), 8, Value('0'))))
+
+
+class Migration(migrations.Migration):
+    """Add Product.sku; existing products get DL-<id> so exports round-trip."""
+
+    dependencies = [
+        ('devloom', '0008_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_skus, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(default=devloom.models.new_sku, max_length=64, unique=True),
+        ),
+    ]
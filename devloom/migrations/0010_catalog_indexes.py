@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:27
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devloom', '0009_product_sku'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='devloom_category_name_ci'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['order', 'product'], name='devloom_orderitem_order_prod'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-created_at', '-id'], name='devloom_product_cat_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at', '-id'], name='devloom_product_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('image__isnull', True), ('image', ''), _connector='OR'), fields=['category', 'id'], name='devloom_product_no_image'),
+        ),
+    ]
@@ -1,6 +1,13 @@
 
+import uuid
+
 from django.db import models
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Lower
 from django.conf import settings
+from django.utils import timezone
+
+from .specs import extract_specs
 
 class Order(models.Model):
     customer_name = models.CharField(max_length=200)
@@ -16,6 +23,11 @@ class OrderItem(models.Model):
     name = models.CharField(max_length=200)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        # rebuild_index walks the history order by order
+        indexes = [models.Index(fields=['order', 'product'], name='devloom_orderitem_order_prod')]
+
     def __str__(self):
         return f"{self.quantity} x {self.name} (Order #{self.order_id})"
 from django.db import models
@@ -25,12 +37,47 @@ from django.db import models
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
+    # denormalized count of products, kept current by devloom.signals
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # the product list resolves ?category= case-insensitively
+        indexes = [models.Index(Lower('name'), name='devloom_category_name_ci')]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored name so a rename can invalidate the old listing
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
+
+    @classmethod
+    def adjust_product_count(cls, category_id, delta):
+        """Atomically move the cached product count of one category."""
+        cls.objects.filter(pk=category_id).update(product_count=F('product_count') + delta)
+
+    @classmethod
+    def refresh_product_counts(cls):
+        """Recount every category in one UPDATE.
+
+        Signals cover single-row saves and deletes; call this after bulk
+        operations (bulk_create, queryset.update) that bypass them.
+        """
+        counts = (Product.objects.filter(category=OuterRef('pk'))
+                  .order_by().values('category').annotate(n=Count('id')).values('n'))
+        cls.objects.update(product_count=Coalesce(Subquery(counts), 0))
+
+
+def new_sku():
+    return f'DL-{uuid.uuid4().hex[:12].upper()}'
+
 
 class Product(models.Model):
+    # natural key used by import_catalog / export_catalog
+    sku = models.CharField(max_length=64, unique=True, default=new_sku)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
@@ -39,6 +86,88 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     image = models.CharField(max_length=255, blank=True, null=True,
                              help_text='Relative static path, e.g. devloom/images/laptop1.jpg')
+    # parsed from the description on save (see devloom.specs)
+    ram_gb = models.PositiveSmallIntegerField(blank=True, null=True, db_index=True)
+    storage_gb = models.PositiveIntegerField(blank=True, null=True, db_index=True,
+                                             help_text='SSD size in GB (1 TB = 1024)')
+
+    class Meta:
+        indexes = [
+            # listing pages are newest first, optionally within one category
+            # (devloom.pagination); the id breaks ties between equal timestamps
+            models.Index(fields=['category', '-created_at', '-id'], name='devloom_product_cat_recent'),
+            models.Index(fields=['-created_at', '-id'], name='devloom_product_recent'),
+            # ensure_images_products pops products still waiting for a picture
+            models.Index(fields=['category', 'id'], condition=Q(image__isnull=True) | Q(image=''),
+                         name='devloom_product_no_image'),
+        ]
 
     def __str__(self):
         return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored category so a recategorize can move the counters
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        instance._loaded_description = instance.__dict__.get('description')
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # re-parse specs only when the description is new or edited, so values
+        # corrected by hand in the admin survive unrelated saves
+        update_fields = kwargs.get('update_fields')
+        writes_description = update_fields is None or 'description' in update_fields
+        if writes_description and (self._state.adding
+                                   or self.description != getattr(self, '_loaded_description', None)):
+            self.ram_gb, self.storage_gb = extract_specs(self.description)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'ram_gb', 'storage_gb'}
+        super().save(*args, **kwargs)
+        # an edit left out of update_fields is still unsaved
+        if writes_description:
+            self._loaded_description = self.description
+
+
+class CoPurchase(models.Model):
+    """Products most often bought together with one product.
+
+    `counts` is a bounded Space-Saving sketch ({other_id: weight}) and `top`
+    its best entries in order; both are maintained incrementally by
+    devloom.recommendations.record_order.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='copurchase')
+    counts = models.JSONField(default=dict)
+    top = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Bought with {self.product_id}: {self.top}"
+
+
+class OutboundEmail(models.Model):
+    """An email waiting in the outbox; delivered by `manage.py send_queued_mail`."""
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENT, 'Sent'), (FAILED, 'Failed')]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='devloom_outbox_due')]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
@@ -0,0 +1,77 @@
+"""Order placement.
+
+An order, its line items, the stock it consumes and the admin notification
+are written in one transaction: either everything lands or nothing does.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .cache import invalidate_product_ids
+from .models import Order, OrderItem, Product
+from .outbox import enqueue_mail
+from .recommendations import record_order
+
+
+class OutOfStock(Exception):
+    """A cart line asks for more units than are left."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.name = name
+
+
+def create_order(customer_name, customer_email, lines):
+    """Create an order from cart ``lines`` ({id, name, price, qty} dicts).
+
+    Stock is taken with one conditional UPDATE per product, so two checkouts
+    racing for the last unit cannot both succeed; the loser gets OutOfStock
+    and its whole transaction rolls back. Returns ``(order, items)`` with the
+    saved line items, so callers need not read them back.
+    """
+    # lock rows in a stable order so concurrent checkouts cannot deadlock
+    lines = sorted(lines, key=lambda it: int(it.get('id')))
+    with transaction.atomic():
+        order = Order.objects.create(customer_name=customer_name, customer_email=customer_email)
+        items = []
+        for it in lines:
+            qty = int(it.get('qty', 1))
+            taken = (Product.objects.filter(id=it.get('id'), stock__gte=qty)
+                     .update(stock=F('stock') - qty))
+            if not taken:
+                raise OutOfStock(it.get('name', ''))
+            items.append(OrderItem(
+                order=order,
+                product_id=it.get('id'),
+                name=it.get('name', ''),
+                price=Decimal(str(it.get('price', 0))),
+                quantity=qty,
+            ))
+        OrderItem.objects.bulk_create(items)
+        product_ids = [item.product_id for item in items]
+        # fold the new order into the "bought together" index
+        record_order(product_ids)
+        notify_admin(order, items)
+        # stock is shown on listing and detail pages; update() skips the signals
+        transaction.on_commit(lambda: invalidate_product_ids(product_ids))
+    return order, items
+
+
+def notify_admin(order, items):
+    """Queue the "new order" email for ADMIN_EMAIL, if one is configured."""
+    admin_email = getattr(settings, 'ADMIN_EMAIL', None)
+    if not admin_email:
+        return
+    subject = f"New Order #{order.id} from {order.customer_name}"
+    item_lines = [f"- {oi.quantity} x {oi.name} @ Ksh {oi.price}" for oi in items]
+    message = (
+        f"A new order has been placed.\n\n"
+        f"Order ID: {order.id}\n"
+        f"Customer: {order.customer_name} <{order.customer_email}>\n"
+        f"Items:\n" + '\n'.join(item_lines) + "\n\n"
+        f"View in admin: /admin/devloom/order/{order.id}/"
+    )
+    enqueue_mail(subject.replace('\n', ' ').replace('\r', ' '), message,
+                 settings.DEFAULT_FROM_EMAIL, [admin_email])
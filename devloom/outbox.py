@@ -0,0 +1,120 @@
+"""Durable outbound email queue.
+
+Views call :func:`enqueue_mail`, which only inserts an OutboundEmail row (in
+the caller's transaction, if any). `manage.py send_queued_mail` drains the
+queue over a single reused backend connection, retrying failures with
+exponential backoff until MAX_ATTEMPTS.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import BadHeaderError, EmailMultiAlternatives, get_connection
+from django.db import connection as db_connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+MAX_ATTEMPTS = getattr(settings, 'DEVLOOM_OUTBOX_MAX_ATTEMPTS', 8)
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=2)
+# how long a claimed message stays invisible to other workers while it is sent
+CLAIM_LEASE = timedelta(minutes=5)
+SUBJECT_MAX_LENGTH = OutboundEmail._meta.get_field('subject').max_length
+
+
+def enqueue_mail(subject, message, from_email, recipient_list, html_message=None):
+    """Queue an email with `send_mail`'s signature; nothing is sent here."""
+    if '\n' in subject or '\r' in subject:
+        # fail now, in the view, rather than on every retry in the worker
+        raise BadHeaderError(f"Header values can't contain newlines (got {subject!r})")
+    if len(subject) > SUBJECT_MAX_LENGTH:
+        # subjects may carry user input (the contact form's name); Postgres
+        # would reject the row rather than cut it
+        subject = subject[:SUBJECT_MAX_LENGTH - 1] + '…'
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        html_body=html_message or '',
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL or '',
+        recipients=list(recipient_list),
+    )
+
+
+def backoff(attempts):
+    """Delay before retry number ``attempts`` (30s, 1m, 2m, ... capped)."""
+    return min(BACKOFF_BASE * 2 ** max(0, attempts - 1), BACKOFF_MAX)
+
+
+def claim_batch(limit):
+    """Lease up to ``limit`` due messages to this worker and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        due = (OutboundEmail.objects
+               .filter(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+               .order_by('next_attempt_at', 'id'))
+        if db_connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        batch = list(due[:limit])
+        OutboundEmail.objects.filter(pk__in=[e.pk for e in batch]).update(next_attempt_at=now + CLAIM_LEASE)
+    return batch
+
+
+def _mark_sent(email):
+    OutboundEmail.objects.filter(pk=email.pk).update(
+        status=OutboundEmail.SENT, sent_at=timezone.now(), attempts=F('attempts') + 1, last_error='')
+
+
+def _mark_failed(email, error):
+    attempts = email.attempts + 1
+    OutboundEmail.objects.filter(pk=email.pk).update(
+        attempts=attempts,
+        last_error=f'{type(error).__name__}: {error}'[:2000],
+        status=OutboundEmail.FAILED if attempts >= MAX_ATTEMPTS else OutboundEmail.PENDING,
+        next_attempt_at=timezone.now() + backoff(attempts),
+    )
+
+
+def _as_message(email, connection):
+    message = EmailMultiAlternatives(email.subject, email.body, email.from_email,
+                                     email.recipients, connection=connection)
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def deliver_pending(batch_size=50, connection=None):
+    """Send every due message; returns ``(sent, failed)``.
+
+    One backend connection (one SMTP session) is opened for the whole run.
+    """
+    sent = failed = 0
+    connection = connection or get_connection()
+    opened = False
+    try:
+        while True:
+            batch = claim_batch(batch_size)
+            if not batch:
+                break
+            if not opened:
+                try:
+                    connection.open()
+                    opened = True
+                except Exception as exc:
+                    for email in batch:
+                        _mark_failed(email, exc)
+                    failed += len(batch)
+                    break
+            for email in batch:
+                try:
+                    _as_message(email, connection).send()
+                except Exception as exc:
+                    _mark_failed(email, exc)
+                    failed += 1
+                else:
+                    _mark_sent(email)
+                    sent += 1
+    finally:
+        if opened:
+            connection.close()
+    return sent, failed
@@ -0,0 +1,125 @@
+"""Keyset (cursor) pagination for product listings.
+
+Rows are ordered newest first by ``(created_at, id)``. A cursor remembers the
+boundary row of the page it came from, so fetching the next or previous page
+is a range seek on those two columns instead of an OFFSET scan: page 500 costs
+the same as page 1.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 96
+
+NEXT = 'n'
+PREV = 'p'
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Clamp a user supplied page size to ``1..MAX_PAGE_SIZE``."""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(direction, created_at, pk):
+    raw = f"{direction}|{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(direction, created_at, pk)`` or ``None`` for a bad cursor."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, created_at, pk = base64.urlsafe_b64decode(padded).decode().split('|')
+        if direction not in (NEXT, PREV):
+            return None
+        return direction, datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """One page of rows plus the cursors needed to move either way."""
+
+    def __init__(self, object_list, page_size, has_next, has_previous):
+        self.object_list = object_list
+        self.page_size = page_size
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    @property
+    def next_cursor(self):
+        if not (self.has_next and self.object_list):
+            return None
+        last = self.object_list[-1]
+        return encode_cursor(NEXT, last.created_at, last.pk)
+
+    @property
+    def previous_cursor(self):
+        if not (self.has_previous and self.object_list):
+            return None
+        first = self.object_list[0]
+        return encode_cursor(PREV, first.created_at, first.pk)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def keyset_queryset(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Return ``(queryset, direction)`` for the page described by ``cursor``.
+
+    The queryset fetches one extra row so :func:`build_page` can tell whether
+    there is another page beyond this one. An invalid cursor falls back to the
+    first page.
+    """
+    decoded = decode_cursor(cursor)
+    if decoded is None:
+        return queryset.order_by('-created_at', '-id')[:page_size + 1], None
+
+    direction, created_at, pk = decoded
+    # ``created_at <= ts`` gives the planner a range to seek on; the OR then
+    # breaks ties between rows sharing the same timestamp.
+    if direction == NEXT:
+        queryset = queryset.filter(
+            Q(created_at__lte=created_at),
+            Q(created_at__lt=created_at) | Q(id__lt=pk),
+        ).order_by('-created_at', '-id')
+    else:
+        queryset = queryset.filter(
+            Q(created_at__gte=created_at),
+            Q(created_at__gt=created_at) | Q(id__gt=pk),
+        ).order_by('created_at', 'id')
+    return queryset[:page_size + 1], direction
+
+
+def build_page(rows, direction, page_size):
+    """Turn the rows fetched for :func:`keyset_queryset` into a page."""
+    rows = list(rows)
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == PREV:
+        rows.reverse()
+        return KeysetPage(rows, page_size, has_next=True, has_previous=has_more)
+    return KeysetPage(rows, page_size, has_next=has_more, has_previous=direction == NEXT)
+
+
+def paginate(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Fetch one keyset page of ``queryset`` (a single query)."""
+    page_qs, direction = keyset_queryset(queryset, cursor, page_size)
+    return build_page(page_qs, direction, page_size)
+
+
+async def apaginate(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """:func:`paginate` for async views, through the async ORM."""
+    page_qs, direction = keyset_queryset(queryset, cursor, page_size)
+    return build_page([row async for row in page_qs], direction, page_size)
@@ -0,0 +1,250 @@
+"""Product recommendations.
+
+Suggestions come from a co-purchase index first ("frequently bought
+together") and are topped up with random picks from a small candidate pool
+of laptop and accessory ids. The pool is sampled with a few short index
+reads and cached, so a cart view never loads or sorts whole categories.
+
+The co-purchase index keeps, per product, a Space-Saving sketch of the
+products ordered alongside it: at most SKETCH_SIZE counters, where a new
+neighbour evicts the smallest counter and inherits its weight. Any neighbour
+bought with the product in more than 1/SKETCH_SIZE of its orders is
+guaranteed to stay, so the TOP_K read from the sketch tracks the true top
+neighbours in bounded space. Each new order only touches the rows of its own
+products.
+"""
+import random
+from itertools import groupby
+
+from asgiref.sync import sync_to_async
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import bump_tags, product_tag
+from .models import Category, CoPurchase, OrderItem, Product
+
+POOL_KEY = 'devloom:recommendations:pool'
+POOL_SIZE = 200
+POOL_TIMEOUT = 60 * 10
+POOL_CATEGORY_KEYWORDS = ('laptop', 'accessor')
+POOL_DRAW = 20
+
+TOP_K = 10
+SKETCH_SIZE = 4 * TOP_K
+
+
+def _pool_draw(category_id, oldest, newest):
+    """Up to POOL_DRAW ids of ``category_id`` from a random point of its range.
+
+    The read is a seek on the (category, -created_at, -id) index. It wraps
+    around to the oldest products when it runs off the newest end, so every
+    product is equally likely to start a draw's window.
+    """
+    in_category = Product.objects.filter(category_id=category_id).order_by('created_at', 'id')
+    at = oldest + (newest - oldest) * random.random()
+    ids = list(in_category.filter(created_at__gte=at).values_list('id', flat=True)[:POOL_DRAW])
+    if len(ids) < POOL_DRAW:
+        ids += in_category.values_list('id', flat=True)[:POOL_DRAW - len(ids)]
+    # a category smaller than one draw comes back whole, each id once
+    return list(dict.fromkeys(ids))
+
+
+def refresh_candidate_pool():
+    """Re-sample the candidate pool and cache it for POOL_TIMEOUT seconds.
+
+    Each draw reads a few rows from a random pool category, so a refresh
+    never sorts or scans whole categories.
+    """
+    in_categories = Q()
+    for keyword in POOL_CATEGORY_KEYWORDS:
+        in_categories |= Q(name__icontains=keyword)
+    ranges = []
+    for category_id in Category.objects.filter(in_categories).values_list('id', flat=True):
+        newest_first = Product.objects.filter(category_id=category_id).order_by('-created_at', '-id')
+        newest = newest_first.values_list('created_at', flat=True).first()
+        if newest is not None:
+            oldest = newest_first.reverse().values_list('created_at', flat=True).first()
+            ranges.append((category_id, oldest, newest))
+
+    pool = set()
+    for _ in range(POOL_SIZE // POOL_DRAW * 2):
+        if not ranges or len(pool) >= POOL_SIZE:
+            break
+        bounds = random.choice(ranges)
+        ids = _pool_draw(*bounds)
+        pool.update(ids)
+        if len(ids) < POOL_DRAW:
+            # the whole category fit in one draw
+            ranges.remove(bounds)
+    pool = list(pool)[:POOL_SIZE]
+    cache.set(POOL_KEY, pool, POOL_TIMEOUT)
+    return pool
+
+
+def candidate_pool():
+    pool = cache.get(POOL_KEY)
+    if pool is None:
+        pool = refresh_candidate_pool()
+    return pool
+
+
+async def acandidate_pool():
+    pool = cache.get(POOL_KEY)
+    if pool is None:
+        # a refresh is a handful of index reads; run them in one thread hop
+        pool = await sync_to_async(refresh_candidate_pool)()
+    return pool
+
+
+def discard_candidate_pool():
+    cache.delete(POOL_KEY)
+
+
+# --- co-purchase index ---
+
+def sketch_add(counts, other, weight=1, capacity=SKETCH_SIZE):
+    """Space-Saving update of one neighbour counter in ``counts``."""
+    if other in counts:
+        counts[other] += weight
+    elif len(counts) < capacity:
+        counts[other] = weight
+    else:
+        victim = min(counts, key=counts.get)
+        counts[other] = counts.pop(victim) + weight
+
+
+def top_neighbors(counts, k=TOP_K):
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return [other for other, _ in ranked[:k]]
+
+
+def fold_order(sketches, product_ids):
+    """Fold one order into ``sketches`` ({product_id: counts}) in place.
+
+    Returns the distinct product ids whose sketches changed.
+    """
+    ids = sorted({pid for pid in product_ids if pid is not None})
+    if len(ids) < 2:
+        return []
+    for pid in ids:
+        counts = sketches.setdefault(pid, {})
+        for other in ids:
+            if other != pid:
+                sketch_add(counts, other)
+    return ids
+
+
+def _load_counts(row):
+    # JSON object keys come back as strings
+    return {int(other): weight for other, weight in row.counts.items()}
+
+
+def record_order(product_ids):
+    """Add one placed order to the co-purchase index (no recompute)."""
+    ids = sorted({pid for pid in product_ids if pid is not None})
+    if len(ids) < 2:
+        return
+    with transaction.atomic():
+        rows = CoPurchase.objects.select_for_update().in_bulk(ids)
+        missing = [pid for pid in ids if pid not in rows]
+        if missing:
+            # a row that does not exist cannot be locked: insert it empty, so a
+            # concurrent first order of the same product waits here instead of
+            # folding into its own empty sketch, then lock it like the rest
+            CoPurchase.objects.bulk_create([CoPurchase(product_id=pid) for pid in missing], ignore_conflicts=True)
+            rows.update(CoPurchase.objects.select_for_update().in_bulk(missing))
+        sketches = {pid: _load_counts(row) for pid, row in rows.items()}
+        fold_order(sketches, ids)
+        now = timezone.now()
+        for pid, row in rows.items():
+            row.counts = sketches[pid]
+            row.top = top_neighbors(sketches[pid])
+            row.updated_at = now
+        CoPurchase.objects.bulk_update(list(rows.values()), ['counts', 'top', 'updated_at'])
+    # detail pages list these neighbours; bumped only once the caller's order
+    # commits, so no page is rendered and cached from the old rows in between
+    transaction.on_commit(lambda: bump_tags(*(product_tag(pid) for pid in ids)))
+
+
+def rebuild_index(chunk_size=10000):
+    """Recompute the whole index from OrderItem history; returns rows written."""
+    # (order, product) order reads straight off the devloom_orderitem_order_prod index
+    items = (OrderItem.objects.filter(product__isnull=False).order_by('order_id', 'product_id')
+             .values_list('order_id', 'product_id').iterator(chunk_size=chunk_size))
+    sketches = {}
+    for _, rows in groupby(items, key=lambda row: row[0]):
+        fold_order(sketches, [product_id for _, product_id in rows])
+
+    existing = set(Product.objects.filter(pk__in=list(sketches)).values_list('pk', flat=True))
+    rows = [CoPurchase(product_id=pid, counts=counts, top=top_neighbors(counts))
+            for pid, counts in sketches.items() if pid in existing]
+    with transaction.atomic():
+        CoPurchase.objects.all().delete()
+        CoPurchase.objects.bulk_create(rows, batch_size=1000)
+    bump_tags(*(product_tag(pid) for pid in existing))
+    return len(rows)
+
+
+def bought_together(product_id, limit=4):
+    """Ids most often bought with ``product_id``: a single primary-key read."""
+    top = CoPurchase.objects.filter(pk=product_id).values_list('top', flat=True).first()
+    return (top or [])[:limit]
+
+
+async def abought_together(product_id, limit=4):
+    top = await CoPurchase.objects.filter(pk=product_id).values_list('top', flat=True).afirst()
+    return (top or [])[:limit]
+
+
+def _merge_copurchases(rows, product_ids, limit):
+    merged = {}
+    for row in rows:
+        for other, weight in _load_counts(row).items():
+            merged[other] = merged.get(other, 0) + weight
+    for pid in product_ids:
+        merged.pop(pid, None)
+    return top_neighbors(merged, limit)
+
+
+def copurchased(product_ids, limit):
+    """Ids most often bought with any of ``product_ids``, best first."""
+    if not product_ids:
+        return []
+    return _merge_copurchases(CoPurchase.objects.filter(pk__in=product_ids), product_ids, limit)
+
+
+def _top_up(picks, exclude, pool, limit):
+    """Fill ``picks`` up to ``limit`` with random candidates from ``pool``."""
+    taken = exclude.union(picks)
+    pool = [pk for pk in pool if pk not in taken]
+    return picks + random.sample(pool, min(limit - len(picks), len(pool)))
+
+
+def recommend_for_cart(cart_ids, limit=3):
+    """Return up to ``limit`` products for a cart holding ``cart_ids``."""
+    exclude = set(cart_ids)
+    picks = copurchased(list(exclude), limit)
+    if len(picks) < limit:
+        picks = _top_up(picks, exclude, candidate_pool(), limit)
+    if not picks:
+        return []
+    products = Product.objects.select_related('category').in_bulk(picks)
+    return [products[pk] for pk in picks if pk in products]
+
+
+async def arecommend_for_cart(cart_ids, limit=3):
+    """:func:`recommend_for_cart` for async views, through the async ORM."""
+    exclude = set(cart_ids)
+    picks = []
+    if exclude:
+        rows = [row async for row in CoPurchase.objects.filter(pk__in=list(exclude))]
+        picks = _merge_copurchases(rows, exclude, limit)
+    if len(picks) < limit:
+        picks = _top_up(picks, exclude, await acandidate_pool(), limit)
+    if not picks:
+        return []
+    products = await Product.objects.select_related('category').ain_bulk(picks)
+    return [products[pk] for pk in picks if pk in products]
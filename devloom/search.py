@@ -0,0 +1,283 @@
+"""Product search.
+
+On SQLite, products are indexed in an FTS5 table (``devloom_product_fts``)
+kept in step with ``devloom_product`` by triggers, so every write path --
+save(), bulk_create(), queryset.update(), raw SQL -- updates the index.
+The last word of a query matches as a prefix for typeahead, and each search
+also returns category and price facets.
+
+Matches are ranked with bm25 (name matches weigh more than description
+matches) when there are at most RANK_LIMIT of them. Scoring costs a few
+microseconds per match, so broader queries ("laptop") list the newest
+matches first instead, which FTS5 reads straight off its rowid order.
+Likewise facets over more than FACET_SAMPLE matches are estimated from the
+newest FACET_SAMPLE. Repeated queries are served from the cache.
+
+Other databases fall back to ``icontains`` filters, which scan the table.
+"""
+import bisect
+import hashlib
+import re
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from .cache import catalog_version
+from .models import Category, Product
+
+FTS_TABLE = 'devloom_product_fts'
+# bm25 column weights: name, description
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+MAX_TERMS = 8
+# shorter prefixes match too much of the catalog to be useful
+MIN_PREFIX_LENGTH = 2
+DEFAULT_LIMIT = 24
+RANK_LIMIT = 1_000
+FACET_SAMPLE = 2_000
+SEARCH_TIMEOUT = 60 * 10
+# Ksh; the last bucket is open ended
+PRICE_BUCKETS = (0, 25_000, 50_000, 100_000, 150_000)
+
+_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON devloom_product BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END""",
+    f'{FTS_TABLE}_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON devloom_product BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+                VALUES ('delete', old.id, old.name, old.description);
+        END""",
+    f'{FTS_TABLE}_au': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON devloom_product BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+                VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END""",
+}
+
+
+# --- index maintenance ---
+
+def install_index(conn):
+    """Create the FTS5 table and triggers (SQLite only) and fill the index.
+
+    Safe to call repeatedly. SQLite migrations that rebuild devloom_product
+    drop its triggers, so this also runs after every ``migrate`` (see
+    devloom.apps) and rebuilds the index if a trigger had to be recreated.
+    """
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                       [f'{FTS_TABLE}_%'])
+        present = {row[0] for row in cursor.fetchall()}
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "name, description, content='devloom_product', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        for sql in _TRIGGERS.values():
+            cursor.execute(sql)
+        if present != set(_TRIGGERS):
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_index(conn):
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for name in _TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def optimize_index(rebuild=False):
+    """Merge the index into one segment, or rebuild it from devloom_product.
+
+    Row-by-row trigger updates leave many small segments behind, which makes
+    queries over common words several times slower; run this after bulk
+    imports (`manage.py search_index`). Returns False without an FTS index.
+    """
+    if not uses_fts():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES (%s)",
+                       ['rebuild' if rebuild else 'optimize'])
+    return True
+
+
+def uses_fts():
+    """Whether the FTS5 index exists on the current connection (checked once)."""
+    if connection.vendor != 'sqlite':
+        return False
+    found = getattr(connection, '_devloom_fts', None)
+    if found is None:
+        found = connection._devloom_fts = FTS_TABLE in connection.introspection.table_names()
+    return found
+
+
+# --- queries ---
+
+def terms(query):
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def match_expression(words, prefix=True):
+    """FTS5 MATCH string: every word must appear, the last one as a prefix."""
+    quoted = [f'"{word}"' for word in words]
+    if prefix and quoted and len(words[-1]) >= MIN_PREFIX_LENGTH:
+        quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def price_buckets():
+    """``(min, max)`` pairs for the price facet; ``max`` is None for the last."""
+    edges = list(PRICE_BUCKETS) + [None]
+    return list(zip(edges, edges[1:]))
+
+
+def _in_range(price, min_price, max_price):
+    return (min_price is None or price >= min_price) and (max_price is None or price < max_price)
+
+
+def _price_filter(min_price=None, max_price=None):
+    q = Q()
+    if min_price is not None:
+        q &= Q(price__gte=min_price)
+    if max_price is not None:
+        q &= Q(price__lt=max_price)
+    return q
+
+
+class SearchResults:
+    """One page of hits plus facet counts over all hits.
+
+    With ``estimated`` set, ``total`` and the facet counts were scaled up
+    from a sample of the matches.
+    """
+
+    def __init__(self, query, products, total, categories, prices, estimated=False):
+        self.query = query
+        self.products = products
+        self.total = total
+        # [{'id', 'name', 'count'}], most hits first
+        self.categories = categories
+        # [{'min', 'max', 'count'}], ``max`` is None for the last bucket
+        self.prices = prices
+        self.estimated = estimated
+
+    def __iter__(self):
+        return iter(self.products)
+
+    def __len__(self):
+        return len(self.products)
+
+
+def _category_facet(counts):
+    names = dict(Category.objects.filter(pk__in=list(counts)).values_list('pk', 'name'))
+    return sorted(
+        ({'id': pk, 'name': names.get(pk, ''), 'count': n} for pk, n in counts.items() if n),
+        key=lambda c: (-c['count'], c['name']),
+    )
+
+
+def _fts_search(words, category_id, min_price, max_price, limit, offset):
+    match = match_expression(words)
+    join = f'{FTS_TABLE} JOIN devloom_product p ON p.id = {FTS_TABLE}.rowid'
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        matches = cursor.fetchone()[0]
+        if not matches:
+            return SearchResults(None, [], 0, [], [])
+
+        # facets and the filtered total, from (category, price) of the matches
+        cursor.execute(f'SELECT p.category_id, p.price FROM {join} WHERE {FTS_TABLE} MATCH %s '
+                       f'ORDER BY {FTS_TABLE}.rowid DESC LIMIT %s', [match, FACET_SAMPLE])
+        rows = cursor.fetchall()
+        buckets = price_buckets()
+        starts = [lo for lo, _ in buckets]
+        by_category, by_price, total = Counter(), Counter(), 0
+        for cat, price in rows:
+            in_price = _in_range(price, min_price, max_price)
+            if in_price:
+                by_category[cat] += 1
+            if not category_id or cat == category_id:
+                by_price[bisect.bisect_right(starts, price) - 1] += 1
+                total += in_price
+        scale = matches / len(rows)
+        if scale > 1:
+            by_category = Counter({k: round(n * scale) for k, n in by_category.items()})
+            by_price = Counter({k: round(n * scale) for k, n in by_price.items()})
+            total = round(total * scale)
+
+        where, params = [f'{FTS_TABLE} MATCH %s'], [match]
+        if category_id:
+            where.append('p.category_id = %s')
+            params.append(category_id)
+        if min_price is not None:
+            where.append('p.price >= %s')
+            params.append(min_price)
+        if max_price is not None:
+            where.append('p.price < %s')
+            params.append(max_price)
+        order = f'{FTS_TABLE}.rowid DESC'
+        if matches <= RANK_LIMIT:
+            order = f'bm25({FTS_TABLE}, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT}), {order}'
+        cursor.execute(f'SELECT {FTS_TABLE}.rowid FROM {join} WHERE {" AND ".join(where)} '
+                       f'ORDER BY {order} LIMIT %s OFFSET %s', params + [limit, offset])
+        ids = [row[0] for row in cursor.fetchall()]
+
+    found = Product.objects.select_related('category').in_bulk(ids)
+    prices = [{'min': lo, 'max': hi, 'count': by_price[i]} for i, (lo, hi) in enumerate(buckets)]
+    return SearchResults(None, [found[pk] for pk in ids if pk in found], total,
+                         _category_facet(by_category), prices, estimated=scale > 1)
+
+
+def _scan_search(words, category_id, min_price, max_price, limit, offset):
+    """icontains fallback for databases without the FTS index."""
+    matched = Product.objects.all()
+    for word in words:
+        matched = matched.filter(Q(name__icontains=word) | Q(description__icontains=word))
+    in_category = Q(category_id=category_id) if category_id else Q()
+    in_price = _price_filter(min_price, max_price)
+
+    ranked = matched.annotate(
+        rank=Case(When(name__icontains=words[0], then=Value(0)), default=Value(1), output_field=IntegerField())
+    ).order_by('rank', '-created_at', '-id')
+    products = list(ranked.filter(in_category, in_price).select_related('category')[offset:offset + limit])
+    total = matched.filter(in_category, in_price).count()
+
+    by_category = dict(matched.filter(in_price).order_by()
+                       .values_list('category_id').annotate(n=Count('id')))
+    buckets = price_buckets()
+    counts = matched.filter(in_category).aggregate(**{
+        f'b{i}': Count('id', filter=_price_filter(lo, hi)) for i, (lo, hi) in enumerate(buckets)
+    })
+    prices = [{'min': lo, 'max': hi, 'count': counts[f'b{i}']} for i, (lo, hi) in enumerate(buckets)]
+    return SearchResults(None, products, total, _category_facet(by_category), prices)
+
+
+def search(query, category_id=None, min_price=None, max_price=None, limit=DEFAULT_LIMIT, offset=0):
+    """Search product names and descriptions.
+
+    ``category_id`` and the price range narrow the hits. Category counts
+    ignore the category filter and price counts ignore the price filter, so
+    a facet always shows what picking another value would give. Results are
+    cached until the next catalog change.
+    """
+    words = terms(query)
+    if not words:
+        return SearchResults(query, [], 0, [], [])
+    args = (words, category_id, min_price, max_price, limit, offset)
+    key = f'devloom:search:{hashlib.sha1(repr(args).encode()).hexdigest()}:{catalog_version()}'
+    results = cache.get(key)
+    if results is None:
+        run = _fts_search if uses_fts() else _scan_search
+        results = run(*args)
+        cache.set(key, results, SEARCH_TIMEOUT)
+    results.query = query
+    return results
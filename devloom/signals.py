@@ -0,0 +1,46 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache, recommendations
+from .models import Category, Product
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, raw=False, **kwargs):
+    """Keep Category.product_count and the page cache in step with a save."""
+    if raw:
+        return
+    previous = getattr(instance, '_loaded_category_id', None)
+    if created:
+        Category.adjust_product_count(instance.category_id, 1)
+    elif previous is not None and previous != instance.category_id:
+        Category.adjust_product_count(previous, -1)
+        Category.adjust_product_count(instance.category_id, 1)
+    instance._loaded_category_id = instance.category_id
+    cache.invalidate_product(instance, previous_category_id=previous)
+    if created or instance.name != getattr(instance, '_loaded_name', None):
+        cache.invalidate_product_names()
+    instance._loaded_name = instance.name
+    if created or previous != instance.category_id:
+        recommendations.discard_candidate_pool()
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    Category.adjust_product_count(instance.category_id, -1)
+    cache.invalidate_product(instance)
+    cache.invalidate_product_names()
+    recommendations.discard_candidate_pool()
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    cache.invalidate_category(instance, previous_name=getattr(instance, '_loaded_name', None))
+    instance._loaded_name = instance.name
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    cache.invalidate_category(instance)
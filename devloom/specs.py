@@ -0,0 +1,34 @@
+"""Structured spec attributes parsed from free-text product descriptions.
+
+Parsing happens when a product is saved (and in `manage.py backfill_specs`),
+never per request; views and filters read the indexed columns.
+"""
+import re
+
+RAM_RE = re.compile(r'(\d{1,3})\s*gb\s*ram')
+STORAGE_RE = re.compile(r'(\d{2,4})\s*(gb|tb)?\s*ssd')
+
+
+def extract_specs(description):
+    """Return ``(ram_gb, storage_gb)`` found in ``description`` (None if absent)."""
+    desc = (description or '').lower()
+    ram_gb = storage_gb = None
+    match = RAM_RE.search(desc)
+    if match:
+        ram_gb = int(match.group(1))
+    match = STORAGE_RE.search(desc)
+    if match:
+        storage_gb = int(match.group(1)) * (1024 if match.group(2) == 'tb' else 1)
+    return ram_gb, storage_gb
+
+
+def format_ram(ram_gb):
+    return f"{ram_gb} GB" if ram_gb is not None else 'N/A'
+
+
+def format_storage(storage_gb):
+    if storage_gb is None:
+        return 'N/A'
+    if storage_gb >= 1024 and storage_gb % 1024 == 0:
+        return f"{storage_gb // 1024} TB SSD"
+    return f"{storage_gb} GB SSD"
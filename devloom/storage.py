@@ -0,0 +1,22 @@
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+
+class VersionedStaticFilesStorage(ManifestStaticFilesStorage):
+    """Content-hashed static URLs that degrade gracefully.
+
+    `collectstatic` copies every file to STATIC_ROOT under a name containing
+    a hash of its contents (home.css -> home.3f2a9c1b7d4e.css) and records the
+    mapping in staticfiles.json, so `{% static %}` URLs only change when the
+    file does and can be served with far-future cache headers.
+
+    Product images are referenced by paths stored in the database, which may
+    point at files that were never collected. Those fall back to their plain
+    name instead of raising and taking the page down with them.
+    """
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
@@ -0,0 +1,107 @@
+"""Typeahead over product names, served from memory.
+
+Each process keeps a :class:`PrefixIndex` of every product name: two sorted
+arrays of normalised keys searched with bisect, one holding whole names and
+one the tail of each name from every later word ("thinkpad t14" for "Lenovo
+ThinkPad T14"). A lookup is a binary search plus a short scan, with no
+database query.
+
+The index is rebuilt when the ``names`` cache tag moves (see
+devloom.signals and cache.invalidate_product_names). That tag is checked at
+most once every CHECK_INTERVAL seconds, so a keystroke usually costs no
+cache round trip either.
+"""
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from .cache import NAMES_TAG, tag_versions
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+CHECK_INTERVAL = 1.0
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse everything but letters and digits."""
+    text = text or ''
+    if not text.isascii():
+        text = ''.join(ch for ch in unicodedata.normalize('NFKD', text) if not unicodedata.combining(ch))
+    return ' '.join(_NON_WORD.sub(' ', text.casefold()).split())
+
+
+class PrefixIndex:
+    """Sorted-array prefix index over ``(id, name)`` pairs."""
+
+    def __init__(self, products):
+        self.names = {}
+        starts, inner = [], []
+        for pk, name in products:
+            self.names[pk] = name
+            words = normalize(name).split(' ')
+            starts.append((' '.join(words), pk))
+            inner.extend((' '.join(words[i:]), pk) for i in range(1, len(words)))
+        starts.sort()
+        inner.sort()
+        self._start_keys = [key for key, _ in starts]
+        self._start_ids = [pk for _, pk in starts]
+        self._inner_keys = [key for key, _ in inner]
+        self._inner_ids = [pk for _, pk in inner]
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def _scan(keys, ids, prefix, limit, found):
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and len(found) < limit and keys[i].startswith(prefix):
+            if ids[i] not in found:
+                found[ids[i]] = None
+            i += 1
+
+    def lookup(self, prefix, limit=DEFAULT_LIMIT):
+        """Up to ``limit`` ``(id, name)`` pairs; names starting with ``prefix`` first."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        found = {}
+        self._scan(self._start_keys, self._start_ids, prefix, limit, found)
+        self._scan(self._inner_keys, self._inner_ids, prefix, limit, found)
+        return [(pk, self.names[pk]) for pk in found]
+
+
+_index = None
+_version = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_index():
+    """This process's index, rebuilt first if product names changed."""
+    global _index, _version, _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < CHECK_INTERVAL:
+        return _index
+    version = tag_versions([NAMES_TAG])[0]
+    with _lock:
+        if _index is None or version != _version:
+            from .models import Product
+
+            _index = PrefixIndex(Product.objects.values_list('id', 'name').iterator(chunk_size=5000))
+            _version = version
+        _checked_at = now
+    return _index
+
+
+def reset():
+    """Forget the index; the next lookup rebuilds it."""
+    global _index, _version
+    _index = _version = None
+
+
+def suggest(prefix, limit=DEFAULT_LIMIT):
+    return get_index().lookup(prefix, max(1, min(limit, MAX_LIMIT)))
@@ -0,0 +1,41 @@
+from django import template
+from django.templatetags.static import static
+
+from ..images import VARIANT_FORMATS, image_variants
+
+register = template.Library()
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+
+def _srcset(variants):
+    return ', '.join(f'{static(path)} {width}w' for width, path in variants)
+
+
+@register.inclusion_tag('devloom/includes/responsive_image.html')
+def responsive_image(path, alt='', css_class='', sizes='100vw', eager=False, style='', img_id=''):
+    """Render a product image as a <picture> with resized derivatives.
+
+    Falls back to the original file (still lazy-loaded) when
+    `build_image_variants` has not produced anything for ``path``.
+    """
+    entry = image_variants(path) or {}
+    variants = entry.get('variants', {})
+    sources = [
+        {'type': MIME_TYPES[fmt], 'srcset': _srcset(variants[fmt])}
+        for fmt in VARIANT_FORMATS[:-1] if variants.get(fmt)
+    ]
+    fallback = variants.get(VARIANT_FORMATS[-1])
+    return {
+        'src': static(path),
+        'srcset': _srcset(fallback) if fallback else '',
+        'sources': sources,
+        'sizes': sizes,
+        'alt': alt,
+        'css_class': css_class,
+        'style': style,
+        'width': entry.get('width'),
+        'height': entry.get('height'),
+        'eager': eager,
+        'img_id': img_id,
+    }
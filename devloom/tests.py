@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import LiveServerTestCase, TestCase
 from django.urls import reverse
 
 
@@ -26,15 +26,608 @@ class DevloomViewsTests(TestCase):
 		self.assertEqual(resp.status_code, 200)
 		self.assertContains(resp, self.product.name)
 
-	def test_add_to_cart_increments_session_and_cart_view(self):
+	def test_add_to_cart_increments_cart_and_cart_view(self):
 		# call add_to_cart (GET)
 		resp = self.client.get(reverse('add_to_cart', args=[self.product.id]), follow=True)
-		# session should have been updated
-		self.assertEqual(int(self.client.session.get('cart_count', 0)), 1)
-
 		# cart view should show the count
 		resp = self.client.get(reverse('cart'))
 		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.context['cart_count'], 1)
 		# the cart template shows the count (simple check)
 		self.assertContains(resp, '1')
 
+
+class CategoryProductCountTests(TestCase):
+	def setUp(self):
+		from .models import Category
+
+		self.laptops = Category.objects.create(name='Laptops')
+		self.desktops = Category.objects.create(name='Desktops')
+
+	def counts(self):
+		from .models import Category
+
+		return dict(Category.objects.values_list('name', 'product_count'))
+
+	def test_create_move_and_delete_keep_counts(self):
+		from .models import Product
+
+		p = Product.objects.create(category=self.laptops, name='A', price=1)
+		Product.objects.create(category=self.laptops, name='B', price=1)
+		self.assertEqual(self.counts(), {'Laptops': 2, 'Desktops': 0})
+
+		p = Product.objects.get(pk=p.pk)
+		p.category = self.desktops
+		p.save()
+		self.assertEqual(self.counts(), {'Laptops': 1, 'Desktops': 1})
+
+		p.name = 'A2'
+		p.save()
+		self.assertEqual(self.counts(), {'Laptops': 1, 'Desktops': 1})
+
+		p.delete()
+		self.assertEqual(self.counts(), {'Laptops': 1, 'Desktops': 0})
+
+	def test_seed_command_and_refresh_agree(self):
+		from io import StringIO
+		from django.core.management import call_command
+		from .models import Category
+
+		call_command('seed_devloom', stdout=StringIO())
+		maintained = self.counts()
+		Category.objects.update(product_count=0)
+		Category.refresh_product_counts()
+		self.assertEqual(self.counts(), maintained)
+		self.assertEqual(maintained['Laptops'], 2)
+
+	def test_product_list_sidebar_runs_no_aggregate(self):
+		from django.db import connection
+		from django.test.utils import CaptureQueriesContext
+
+		with CaptureQueriesContext(connection) as ctx:
+			resp = self.client.get(reverse('product_list'))
+		self.assertEqual(resp.context['total_products'], 0)
+		self.assertFalse(any('COUNT(' in q['sql'].upper() for q in ctx.captured_queries))
+
+class StaticVersioningTests(TestCase):
+	def test_static_version_is_stable_across_requests(self):
+		from .context_processors import static_version
+
+		self.assertEqual(static_version(None), static_version(None))
+		self.assertNotContains(self.client.get(reverse('home')), 'home.css?v=')
+
+	def test_uncollected_files_fall_back_to_plain_url(self):
+		from django.contrib.staticfiles.storage import staticfiles_storage
+
+		url = staticfiles_storage.url('devloom/images/not-collected.png')
+		self.assertTrue(url.endswith('devloom/images/not-collected.png'))
+
+class ResponsiveImageTests(TestCase):
+	def render(self, path):
+		from django.template import Context, Template
+
+		return Template(
+			"{% load devloom_images %}{% responsive_image path alt='Pic' sizes='50vw' %}"
+		).render(Context({'path': path}))
+
+	def test_falls_back_to_lazy_original_without_variants(self):
+		from unittest import mock
+
+		with mock.patch('devloom.templatetags.devloom_images.image_variants', return_value=None):
+			html = self.render('devloom/images/x.png')
+		self.assertIn('devloom/images/x.png', html)
+		self.assertIn('loading="lazy"', html)
+		self.assertNotIn('srcset', html)
+
+	def test_emits_sources_and_srcset_from_manifest(self):
+		from unittest import mock
+
+		entry = {'width': 900, 'height': 600, 'variants': {
+			'webp': [[320, 'devloom/images/variants/x-320.webp'], [640, 'devloom/images/variants/x-640.webp']],
+			'jpeg': [[320, 'devloom/images/variants/x-320.jpg']],
+		}}
+		with mock.patch('devloom.templatetags.devloom_images.image_variants', return_value=entry):
+			html = self.render('devloom/images/x.png')
+		self.assertIn('type="image/webp"', html)
+		self.assertIn('x-320.webp 320w, /static/devloom/images/variants/x-640.webp 640w', html)
+		self.assertIn('x-320.jpg 320w', html)
+		self.assertIn('width="900" height="600"', html)
+		self.assertNotIn('image/avif', html)
+
+	def test_bad_widths_are_a_command_error(self):
+		from django.core.management import call_command
+		from django.core.management.base import CommandError
+
+		for widths in ('320,abc', '0,640', ','):
+			with self.assertRaisesMessage(CommandError, '--widths takes comma separated positive integers'):
+				call_command('build_image_variants', '--widths', widths)
+
+	def test_new_variants_drop_cached_markup(self):
+		import tempfile
+		from io import StringIO
+		from pathlib import Path
+		from unittest import mock
+		from PIL import Image
+		from django.core.management import call_command
+
+		tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(tmp.cleanup)
+		images = Path(tmp.name)
+		Image.new('RGB', (800, 600), 'navy').save(images / 'laptop.png')
+		module = 'devloom.management.commands.build_image_variants'
+		with mock.patch(f'{module}.IMAGES_DIR', images), \
+				mock.patch(f'{module}.VARIANTS_DIR', images / 'variants'), \
+				mock.patch(f'{module}.VARIANT_MANIFEST', images / 'variants' / 'manifest.json'), \
+				mock.patch(f'{module}.invalidate_catalog') as invalidate:
+			call_command('build_image_variants', '--widths', '320', stdout=StringIO())
+			self.assertEqual(invalidate.call_count, 1)
+			call_command('build_image_variants', '--widths', '320', stdout=StringIO())
+			self.assertEqual(invalidate.call_count, 1)
+
+class ProductSpecsTests(TestCase):
+	def setUp(self):
+		from .models import Category
+
+		self.cat = Category.objects.create(name='Laptops')
+
+	def test_specs_parsed_on_save_and_shown_on_detail(self):
+		from .models import Product
+
+		p = Product.objects.create(category=self.cat, name='Book', price=1,
+								   description='Fast 16GB RAM, 512 GB SSD')
+		self.assertEqual((p.ram_gb, p.storage_gb), (16, 512))
+		resp = self.client.get(reverse('product_detail', args=[p.id]))
+		self.assertContains(resp, '16 GB')
+		self.assertContains(resp, '512 GB SSD')
+
+		p = Product.objects.get(pk=p.pk)
+		p.ram_gb = 32
+		p.save()
+		self.assertEqual(Product.objects.get(pk=p.pk).ram_gb, 32)
+		p.description = '8 gb ram, 256 ssd'
+		p.save()
+		self.assertEqual((p.ram_gb, p.storage_gb), (8, 256))
+
+		# a save that leaves the description out does not count it as stored
+		p.description = '64GB RAM 2048GB SSD'
+		p.save(update_fields=['name'])
+		self.assertEqual(Product.objects.get(pk=p.pk).storage_gb, 256)
+		p.save(update_fields=['description'])
+		self.assertEqual(Product.objects.get(pk=p.pk).storage_gb, 2048)
+
+	def test_backfill_and_catalog_filters(self):
+		from io import StringIO
+		from django.core.management import call_command
+		from .models import Product
+
+		big = Product.objects.create(category=self.cat, name='Big', price=1, description='32gb ram 1024gb ssd')
+		small = Product.objects.create(category=self.cat, name='Small', price=1, description='8gb ram 256gb ssd')
+		Product.objects.update(ram_gb=None, storage_gb=None)
+
+		call_command('backfill_specs', stdout=StringIO())
+		self.assertEqual(Product.objects.get(pk=small.pk).storage_gb, 256)
+
+		resp = self.client.get(reverse('product_list'), {'min_ram': 16, 'min_storage': 512})
+		self.assertEqual([p.name for p in resp.context['page']], [big.name])
+
+
+class CatalogImportExportTests(TestCase):
+	def setUp(self):
+		import tempfile
+		from .models import Category, Product
+
+		self.tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(self.tmp.cleanup)
+		self.cat = Category.objects.create(name='Laptops')
+		self.existing = Product.objects.create(category=self.cat, name='Old', sku='A-1', price=100,
+											   stock=1, description='8gb ram')
+
+	def write(self, name, text):
+		import os
+
+		path = os.path.join(self.tmp.name, name)
+		with open(path, 'w', newline='', encoding='utf-8') as f:
+			f.write(text)
+		return path
+
+	def test_csv_import_upserts_by_sku(self):
+		from io import StringIO
+		from django.core.management import call_command
+		from .models import Category, Product
+
+		path = self.write('catalog.csv', (
+			'sku,name,category,price,stock,description,image\n'
+			'A-1,Old,Laptops,120,1,8gb ram,\n'
+			'B-2,New,Phones,50.5,3,16gb ram 512gb ssd,devloom/images/b.jpg\n'
+			'C-3,Broken,Phones,lots,1,,\n'
+		))
+		out, err = StringIO(), StringIO()
+		call_command('import_catalog', path, stdout=out, stderr=err)
+		self.assertIn('Created 1, updated 1, unchanged 0, skipped 1', out.getvalue())
+		self.assertIn("line 4: price 'lots' is not a number", err.getvalue())
+
+		old = Product.objects.get(sku='A-1')
+		self.assertEqual((old.pk, str(old.price), old.ram_gb), (self.existing.pk, '120.00', 8))
+		new = Product.objects.get(sku='B-2')
+		self.assertEqual((new.category.name, new.ram_gb, new.storage_gb, new.image),
+						 ('Phones', 16, 512, 'devloom/images/b.jpg'))
+		# bulk writes skip the signals; the import recounts afterwards
+		self.assertEqual(Category.objects.get(name='Phones').product_count, 1)
+
+		call_command('import_catalog', path, stdout=out, stderr=StringIO())
+		self.assertIn('Created 0, updated 0, unchanged 2', out.getvalue())
+
+	def test_jsonl_partial_rows_leave_other_columns(self):
+		from io import StringIO
+		from django.core.management import call_command
+		from .models import Product
+
+		self.existing.ram_gb = 12  # corrected by hand; survives an import that keeps the description
+		self.existing.save(update_fields=['ram_gb'])
+		path = self.write('stock.jsonl', '{"sku": "A-1", "stock": 9}\n{"sku": "Z-9", "stock": 1}\nnot json\n')
+		err = StringIO()
+		call_command('import_catalog', path, stdout=StringIO(), stderr=err)
+		p = Product.objects.get(sku='A-1')
+		self.assertEqual((p.stock, p.name, p.ram_gb), (9, 'Old', 12))
+		self.assertIn('line 2: new product needs name, category, price', err.getvalue())
+		self.assertIn('line 3: invalid JSON', err.getvalue())
+
+	def test_export_round_trips(self):
+		import json
+		from io import StringIO
+		from django.core.management import call_command
+		from .models import Product
+
+		out = StringIO()
+		call_command('export_catalog', stdout=out)
+		self.assertEqual(out.getvalue().splitlines()[:2], [
+			'sku,name,category,price,stock,description,image', 'A-1,Old,Laptops,100.00,1,8gb ram,'])
+
+		path = f'{self.tmp.name}/catalog.jsonl'
+		call_command('export_catalog', '-o', path, stdout=StringIO())
+		with open(path, encoding='utf-8') as f:
+			row = json.loads(f.readline())
+		self.assertEqual(row, {'sku': 'A-1', 'name': 'Old', 'category': 'Laptops', 'price': '100.00',
+							   'stock': 1, 'description': '8gb ram', 'image': None})
+
+		Product.objects.all().delete()
+		call_command('import_catalog', path, stdout=StringIO())
+		self.assertEqual(Product.objects.get(sku='A-1').name, 'Old')
+
+
+class ImageMatchingTests(TestCase):
+	def test_index_scores_rare_tokens_and_spreads_fallbacks(self):
+		from .images import ProductNameIndex
+
+		index = ProductNameIndex([
+			(1, 'Lenovo ThinkPad T14', 10, None),
+			(2, 'Lenovo IdeaPad', 10, None),
+			(3, 'Dell XPS', 10, 'devloom/images/xps.jpg'),
+			(4, 'Gaming Bag', 20, None),
+			(5, 'Gaming Bag', 20, None),
+		])
+		files = [
+			'laptop lenovo thinkpad.png',  # "thinkpad" is rarer than "lenovo"
+			'Laptop 1.png',  # no name match: next laptop without an image
+			'Laptop 2.png',  # none left: first laptop
+			'dell xps front.jpg',  # no category keyword: whole name required
+			'lenovo.jpg',
+			'bag gaming.jpg',
+			'bag gaming 2.jpg',  # equal scores: the product not yet taken
+		]
+		self.assertEqual(index.match(files, {'laptops': 10, 'accessories': 20}),
+						 list(zip(files, [1, 2, 1, 3, None, 4, 5])))
+
+	def test_assign_images_bulk_updates(self):
+		from io import StringIO
+		from django.core.management import call_command
+		from .models import Category, Product
+
+		laptops = Category.objects.create(name='Laptops')
+		for i in range(3):
+			Product.objects.create(category=laptops, name=f'Laptop {i}', price=1)
+		with self.assertNumQueries(5):
+			call_command('assign_images', stdout=StringIO())
+		self.assertEqual(Product.objects.filter(image__startswith='devloom/images/Laptop').count(), 3)
+
+
+class EnsureImagesProductsTests(TestCase):
+	def setUp(self):
+		import tempfile
+		from pathlib import Path
+		from unittest import mock
+		from .models import Category, Product
+
+		tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(tmp.cleanup)
+		self.dir = Path(tmp.name)
+		module = 'devloom.management.commands.ensure_images_products'
+		for name, value in (('IMAGES_DIR', self.dir), ('SCAN_MANIFEST', self.dir / '.scan-manifest.json')):
+			patcher = mock.patch(f'{module}.{name}', value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+		self.laptops = Category.objects.create(name='Laptops')
+		self.waiting = Product.objects.create(category=self.laptops, name='No Photo', price=1)
+
+	def run_command(self):
+		from io import StringIO
+		from django.core.management import call_command
+
+		out = StringIO()
+		call_command('ensure_images_products', '--apply', stdout=out)
+		return out.getvalue()
+
+	def test_only_new_or_changed_files_are_processed(self):
+		from .models import Category, Product
+
+		(self.dir / 'Laptop a.png').write_bytes(b'a')
+		(self.dir / 'Laptop b.png').write_bytes(b'b')
+		(self.dir / 'logo.png').write_bytes(b'logo')
+		self.assertIn('created 1 products and assigned images to 1 existing', self.run_command())
+		self.assertEqual(Product.objects.get(pk=self.waiting.pk).image, 'devloom/images/Laptop a.png')
+		self.assertEqual(Category.objects.get(pk=self.laptops.pk).product_count, 2)
+
+		with self.assertNumQueries(0):
+			self.assertIn('All 2 product images are up to date', self.run_command())
+
+		# a renamed file keeps its product instead of creating another
+		(self.dir / 'Laptop a.png').rename(self.dir / 'Laptop a2.png')
+		(self.dir / 'Laptop c.png').write_bytes(b'c')
+		out = self.run_command()
+		self.assertIn('2 new or changed files, 1 unchanged', out)
+		self.assertIn('created 1 products and assigned images to 1 existing', out)
+		self.assertEqual(Product.objects.get(pk=self.waiting.pk).image, 'devloom/images/Laptop a2.png')
+		self.assertEqual(Product.objects.count(), 3)
+
+
+	def test_identical_copy_gets_no_product(self):
+		from .models import Product
+
+		(self.dir / 'Laptop a.png').write_bytes(b'a')
+		self.run_command()
+		(self.dir / 'Laptop a - Copy.png').write_bytes(b'a')
+		self.assertIn('Laptop a - Copy.png -> same image as Laptop a.png', self.run_command())
+		self.assertEqual(Product.objects.count(), 1)
+
+	def test_deleted_file_clears_its_product_image(self):
+		from io import StringIO
+		from django.core.management import call_command
+		from .models import Product
+
+		(self.dir / 'Laptop a.png').write_bytes(b'a')
+		self.run_command()
+		(self.dir / 'Laptop a.png').unlink()
+
+		out = StringIO()
+		call_command('ensure_images_products', '--preview', stdout=out)
+		self.assertIn('Laptop a.png -> file is gone; No Photo will have no image', out.getvalue())
+		self.assertEqual(Product.objects.get(pk=self.waiting.pk).image, 'devloom/images/Laptop a.png')
+
+		self.assertIn('Cleared the image of 1 products', self.run_command())
+		self.assertIsNone(Product.objects.get(pk=self.waiting.pk).image)
+		self.assertIn('All 0 product images are up to date', self.run_command())
+
+
+class DedupeImagesTests(TestCase):
+	def setUp(self):
+		import tempfile
+		from pathlib import Path
+		from unittest import mock
+		from PIL import Image, ImageDraw
+
+		tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(tmp.cleanup)
+		self.dir = Path(tmp.name)
+		module = 'devloom.management.commands.dedupe_images'
+		for name, value in (('IMAGES_DIR', self.dir), ('SCAN_MANIFEST', self.dir / '.scan-manifest.json')):
+			patcher = mock.patch(f'{module}.{name}', value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+		img = Image.new('RGB', (320, 240), 'white')
+		draw = ImageDraw.Draw(img)
+		draw.rectangle((20, 30, 150, 200), fill='navy')
+		draw.ellipse((170, 40, 300, 180), fill='orange')
+		img.save(self.dir / 'laptop.png')
+		(self.dir / 'laptop - Copy.png').write_bytes((self.dir / 'laptop.png').read_bytes())
+		img.resize((160, 120)).save(self.dir / 'laptop small.jpg', quality=70)
+		other = Image.new('RGB', (320, 240), 'black')
+		ImageDraw.Draw(other).rectangle((200, 20, 300, 220), fill='yellow')
+		other.save(self.dir / 'mouse.png')
+
+	def test_groups_and_repoints_duplicates(self):
+		from io import StringIO
+		from django.core.management import call_command
+		from .models import Category, Product
+
+		cat = Category.objects.create(name='Laptops')
+		copy = Product.objects.create(category=cat, name='A', price=1, image='devloom/images/laptop - Copy.png')
+		small = Product.objects.create(category=cat, name='B', price=1, image='devloom/images/laptop small.jpg')
+
+		out = StringIO()
+		call_command('dedupe_images', stdout=out)
+		self.assertIn('1 groups of duplicate images', out.getvalue())
+		self.assertIn('laptop - Copy.png: identical', out.getvalue())
+		self.assertIn('1 copies', out.getvalue())
+		self.assertIn('1 similar but not identical images are kept', out.getvalue())
+		self.assertEqual(Product.objects.get(pk=copy.pk).image, 'devloom/images/laptop - Copy.png')
+
+		# the look-alike may be another colour of the product: only identical files merge
+		call_command('dedupe_images', '--apply', '--prune', stdout=StringIO())
+		self.assertEqual(Product.objects.get(pk=copy.pk).image, 'devloom/images/laptop.png')
+		self.assertEqual(Product.objects.get(pk=small.pk).image, 'devloom/images/laptop small.jpg')
+		self.assertFalse((self.dir / 'laptop - Copy.png').exists())
+
+		call_command('dedupe_images', '--apply', '--prune', '--merge-similar', stdout=StringIO())
+		self.assertEqual(Product.objects.get(pk=small.pk).image, 'devloom/images/laptop.png')
+		self.assertEqual(sorted(p.name for p in self.dir.glob('*.*') if not p.name.startswith('.')),
+						 ['laptop.png', 'mouse.png'])
+
+		out = StringIO()
+		call_command('dedupe_images', '--max-distance', '0', stdout=out)
+		self.assertIn('No duplicates among 2 images (0 hashed)', out.getvalue())
+
+
+class DatabaseSettingsTests(TestCase):
+	def test_sqlite_connections_are_tuned(self):
+		from django.db import connection
+
+		if connection.vendor != 'sqlite':
+			self.skipTest('SQLite only')
+		with connection.cursor() as cursor:
+			cursor.execute('PRAGMA synchronous')
+			self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+			cursor.execute('PRAGMA temp_store')
+			self.assertEqual(cursor.fetchone()[0], 2)  # MEMORY
+		self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+	def test_asgi_does_not_persist_connections(self):
+		import os
+		import subprocess
+		import sys
+		from django.conf import settings
+
+		script = ('import Website.{}; from django.conf import settings; '
+				  'print(settings.DATABASES["default"]["CONN_MAX_AGE"])')
+		env = {k: v for k, v in os.environ.items() if k != 'DB_CONN_MAX_AGE'}
+		env.setdefault('SECRET_KEY', 'test')
+		for module, expected in (('asgi', '0'), ('wsgi', '60')):
+			out = subprocess.run([sys.executable, '-c', script.format(module)], cwd=settings.BASE_DIR, env=env,
+								 capture_output=True, text=True, check=True).stdout
+			self.assertEqual(out.strip(), expected)
+
+
+class QueryPlanTests(TestCase):
+	"""The hot catalog queries are served by the indexes declared in Meta."""
+
+	def setUp(self):
+		from django.db import connection
+		from .models import Category, Product
+
+		if connection.vendor != 'sqlite':
+			self.skipTest('asserts on SQLite EXPLAIN QUERY PLAN output')
+		self.cat = Category.objects.create(name='Laptops')
+		for i in range(30):
+			Product.objects.create(category=self.cat, name=f'Laptop {i}', price=100 + i, stock=5,
+								   image='' if i % 2 else f'devloom/images/laptop{i}.jpg')
+
+	def plans(self, run):
+		"""Run ``run()`` and return ``{sql: query plan}`` for each SELECT it made."""
+		from django.db import connection
+		from django.test.utils import CaptureQueriesContext
+
+		with CaptureQueriesContext(connection) as ctx:
+			run()
+		plans = {}
+		with connection.cursor() as cursor:
+			for query in ctx.captured_queries:
+				if query['sql'].startswith('SELECT'):
+					cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+					plans[query['sql']] = ' | '.join(row[-1] for row in cursor.fetchall())
+		return plans
+
+	def assertPlanUses(self, plans, table_clue, index):
+		matching = [plan for sql, plan in plans.items() if table_clue in sql]
+		self.assertTrue(matching, f'no query matched {table_clue!r}')
+		for plan in matching:
+			self.assertIn(f'INDEX {index}', plan)
+
+	def test_product_list_pages(self):
+		from django.core.cache import cache
+
+		cache.clear()
+		url = reverse('product_list')
+		plans = self.plans(lambda: self.client.get(url, {'category': 'LAPTOPS', 'page_size': 12}))
+		self.assertPlanUses(plans, 'LOWER("devloom_category"."name")', 'devloom_category_name_ci')
+		self.assertPlanUses(plans, 'ORDER BY "devloom_product"."created_at" DESC', 'devloom_product_cat_recent')
+
+		cursor = self.client.get(url, {'category': 'laptops', 'page_size': 12}).context['page'].next_cursor
+		plans = self.plans(lambda: self.client.get(url, {'category': 'laptops', 'page_size': 12, 'cursor': cursor}))
+		self.assertPlanUses(plans, 'ORDER BY "devloom_product"."created_at" DESC', 'devloom_product_cat_recent')
+
+		plans = self.plans(lambda: self.client.get(url, {'page_size': 12}))
+		self.assertPlanUses(plans, 'ORDER BY "devloom_product"."created_at" DESC', 'devloom_product_recent')
+
+	def test_products_without_images(self):
+		from .management.commands.ensure_images_products import Command
+
+		plans = self.plans(lambda: Command()._plan([], {}, {}))
+		self.assertPlanUses(plans, '"devloom_product"."image" IS NULL', 'devloom_product_no_image')
+
+	def test_copurchase_rebuild(self):
+		from . import recommendations
+		from .orders import create_order
+
+		create_order('A', 'a@example.com', [{'id': p, 'name': 'x', 'price': 1, 'qty': 1}
+											for p in self.cat.products.values_list('id', flat=True)[:3]])
+		plans = self.plans(recommendations.rebuild_index)
+		self.assertPlanUses(plans, 'FROM "devloom_orderitem"', 'devloom_orderitem_order_prod')
+
+
+class LoadTestCommandTests(LiveServerTestCase):
+	def test_reports_each_route(self):
+		from io import StringIO
+		from django.core.management import call_command
+		from .models import Category, Product
+
+		cat = Category.objects.create(name='Laptops')
+		Product.objects.create(category=cat, name='Zen', price=10, stock=5)
+		out = StringIO()
+		call_command('loadtest', self.live_server_url, '--seconds', '0.5', '--concurrency', '2',
+					 '--bust-cache', stdout=out)
+		rows = {line.split()[0]: line.split() for line in out.getvalue().splitlines()[3:]}
+		self.assertIn('/products/?category=Laptops', rows)
+		self.assertIn('/api/v1/categories/', rows)
+		self.assertEqual(rows['all'][-1], '0')  # no errors
+		self.assertGreater(float(rows['all'][1]), 0)
+
+
+class BenchViewsTests(TestCase):
+	def test_every_route_is_measured_and_regressions_fail(self):
+		import contextlib
+		import json
+		import os
+		import tempfile
+		from io import StringIO
+		from unittest import mock
+		from django.core.management import call_command
+		from django.core.management.base import CommandError
+		from .management.commands import bench_views
+		from .urls import urlpatterns
+
+		fd, path = tempfile.mkstemp(suffix='.json')
+		os.close(fd)
+		self.addCleanup(os.remove, path)
+		# timings from two-request runs are noise; only query counts are compared here
+		args = ['--sizes', '40', '--requests', '2', '--warmup', '1', '--tolerance', '1000']
+		# the test database is already a throwaway one
+		with mock.patch.object(bench_views, 'throwaway_database', contextlib.nullcontext):
+			call_command('bench_views', *args, '--save', path, stdout=StringIO())
+			with open(path) as fh:
+				saved = json.load(fh)
+			routes = saved['sizes']['40']['routes']
+			self.assertEqual({label.split(':')[0] for label in routes}, {p.name for p in urlpatterns})
+			self.assertFalse([label for label, row in routes.items() if 'error' in row])
+			self.assertEqual(routes['product_list']['queries'], 2)
+
+			out = StringIO()
+			call_command('bench_views', *args, '--baseline', path, stdout=out)
+			self.assertIn('No regressions', out.getvalue())
+
+			routes['product_list']['queries'] = 1
+			with open(path, 'w') as fh:
+				json.dump(saved, fh)
+			with self.assertRaisesMessage(CommandError, '1 benchmark failures'):
+				call_command('bench_views', *args, '--baseline', path, stdout=out)
+			self.assertIn('40 products, product_list: 2 queries, baseline 1', out.getvalue())
+
+	def test_latency_needs_relative_and_absolute_growth(self):
+		from .management.commands.bench_views import compare
+
+		def run(p95):
+			return {'sizes': {'100': {'routes': {'home': {'p95_ms': p95, 'queries': 0, 'peak_kb': 10}}}}}
+
+		self.assertEqual(compare(run(1.0), run(1.9), 0.25, 2.0), [])  # +90% but under 2 ms
+		self.assertEqual(compare(run(20.0), run(24.0), 0.25, 2.0), [])  # +4 ms but under 25%
+		self.assertEqual(compare(run(20.0), run(26.0), 0.25, 2.0),
+						 ['100 products, home: p95 26.0 ms, baseline 20.0 ms'])
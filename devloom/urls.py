@@ -1,14 +1,40 @@
+from django.conf import settings
 from django.urls import path
-from . import views
-
-urlpatterns = [
-    path('', views.home, name='home'),
-    path('products/', views.product_list, name='product_list'),
-    path('products/<int:id>/', views.product_detail, name='product_detail'),
-    path('cart/', views.cart_view, name='cart'),
-    path('cart/add/<int:id>/', views.add_to_cart, name='add_to_cart'),
-    path('cart/remove/<int:id>/', views.remove_from_cart, name='remove_from_cart'),
-    path('cart/order/', views.place_order, name='place_order'),
-    path('about/', views.about, name='about'),
-    path('contact/', views.contact, name='contact'),
-]
+from . import api, metrics, views
+
+
+def build_urlpatterns(async_views=False):
+    """The app's routes; ``async_views`` serves the ``async def`` twins.
+
+    The product list, product detail, cart and /api/v1/ views each have an
+    async twin using the async ORM. ASGI servers run those natively, so
+    DEVLOOM_ASYNC_VIEWS (on by default in Website.asgi) picks them there.
+    """
+    catalog = {
+        'product_list': views.aproduct_list if async_views else views.product_list,
+        'product_detail': views.aproduct_detail if async_views else views.product_detail,
+        'cart': views.acart_view if async_views else views.cart_view,
+        'api_products': api.aproducts if async_views else api.products,
+        'api_product': api.aproduct if async_views else api.product,
+        'api_categories': api.acategories if async_views else api.categories,
+    }
+    return [
+        path('', views.home, name='home'),
+        path('products/', catalog['product_list'], name='product_list'),
+        path('products/<int:id>/', catalog['product_detail'], name='product_detail'),
+        path('search/', views.search, name='search'),
+        path('api/suggest', api.suggest, name='api_suggest'),
+        path('api/v1/products/', catalog['api_products'], name='api_products'),
+        path('api/v1/products/<int:id>/', catalog['api_product'], name='api_product'),
+        path('api/v1/categories/', catalog['api_categories'], name='api_categories'),
+        path('cart/', catalog['cart'], name='cart'),
+        path('cart/add/<int:id>/', views.add_to_cart, name='add_to_cart'),
+        path('cart/remove/<int:id>/', views.remove_from_cart, name='remove_from_cart'),
+        path('cart/order/', views.place_order, name='place_order'),
+        path('about/', views.about, name='about'),
+        path('contact/', views.contact, name='contact'),
+        path('metrics', metrics.metrics_view, name='metrics'),
+    ]
+
+
+urlpatterns = build_urlpatterns(getattr(settings, 'DEVLOOM_ASYNC_VIEWS', False))
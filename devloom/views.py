@@ -1,5 +1,5 @@
 # Contact page view (professional, with email sending and feedback)
-from django.core.mail import send_mail, BadHeaderError
+from django.core.mail import BadHeaderError
 from django.contrib import messages
 from django.conf import settings
 from django.utils.html import strip_tags
@@ -34,7 +34,8 @@ def contact(request):
         plain_message = strip_tags(html_message)
         recipient = getattr(settings, 'CONTACT_EMAIL', None) or getattr(settings, 'DEFAULT_FROM_EMAIL', None) or 'devloomspace@gmail.com'
         try:
-            send_mail(
+            # queued for `manage.py send_queued_mail`; no SMTP round trip here
+            enqueue_mail(
                 subject,
                 plain_message,
                 settings.DEFAULT_FROM_EMAIL,
@@ -50,139 +51,216 @@ def contact(request):
             # Optionally log the error: print(e)
         return render(request, 'devloom/contact.html', {'name': name, 'email': email, 'message': message})
     return render(request, 'devloom/contact.html')
-from django.shortcuts import render, get_object_or_404, redirect
-from django.db.models import Count
+from django.db.models import Value
+from django.db.models.functions import Lower
+from django.shortcuts import aget_object_or_404, render, get_object_or_404, redirect
+from .cart import subtotal as cart_subtotal
+from .cache import cache_anonymous_page, card_generation, list_tag, product_tag
 from .models import Product, Category
+from .pagination import apaginate, paginate, parse_page_size
+from .search import DEFAULT_LIMIT as SEARCH_PAGE_SIZE, search as product_search
+from .orders import OutOfStock, create_order
+from .outbox import enqueue_mail
+from .recommendations import abought_together, arecommend_for_cart, bought_together, recommend_for_cart
+from .specs import format_ram, format_storage
 from urllib.parse import quote
 
+# ranked results are paged by offset; nobody reads past the first few pages
+SEARCH_MAX_PAGES = 20
 
+
+@cache_anonymous_page()
 def home(request):
     return render(request, 'devloom/home.html')
 
 
+def _category_named(name):
+    # LOWER() on both sides matches the devloom_category_name_ci index;
+    # name__iexact compiles to LIKE on SQLite, which cannot use it
+    return Category.objects.alias(name_ci=Lower('name')).filter(name_ci=Lower(Value(name)))
+
+
+def _spec_filtered(request, products):
+    # spec filters hit the indexed ram_gb / storage_gb columns
+    for param, field in (('min_ram', 'ram_gb__gte'), ('min_storage', 'storage_gb__gte')):
+        try:
+            products = products.filter(**{field: int(request.GET[param])})
+        except (KeyError, ValueError):
+            pass
+    return products
+
+
+def _render_product_list(request, page, categories, current_category):
+    context = {
+        'products': page.object_list,
+        'page': page,
+        'categories': categories,
+        'current_category': current_category,
+        # total products overall (used for "All" badge)
+        'total_products': sum(c.product_count for c in categories),
+        'card_generation': card_generation(),
+    }
+    return render(request, 'devloom/product_list.html', context)
+
+
+@cache_anonymous_page(lambda request: [list_tag(request.GET.get('category'))])
 def product_list(request):
     """Show products. Optional GET param `category` filters by category name.
 
     Examples:
     - /products/                     -> all products
     - /products/?category=laptops    -> products in category named 'laptops' (case-insensitive)
+    - /products/?min_ram=16&min_storage=512 -> at least 16 GB RAM and a 512 GB SSD
+
+    Results are keyset paginated newest first; `cursor` and `page_size`
+    (capped at `pagination.MAX_PAGE_SIZE`) select the page.
     """
     category_q = request.GET.get('category')
-    # annotate categories with product counts so templates can show badges
-    categories = Category.objects.annotate(product_count=Count('products'))
-    products = Product.objects.all()
-
-    # total products overall (used for "All" badge)
-    total_products = Product.objects.count()
+    # product_count is a maintained column, so badges need no aggregation
+    categories = list(Category.objects.all())
+    # the grid prints product.category.name, so join it in the page query
+    products = Product.objects.select_related('category')
 
     current_category = None
     if category_q:
         # try to find a matching category by name (case-insensitive)
         try:
-            current_category = Category.objects.get(name__iexact=category_q)
+            current_category = _category_named(category_q).get()
             products = products.filter(category=current_category)
         except Category.DoesNotExist:
             # no matching category -> empty queryset
             products = products.none()
 
-    context = {
-        'products': products,
-        'categories': categories,
-        'current_category': current_category,
-        'total_products': total_products,
-    }
-    return render(request, 'devloom/product_list.html', context)
+    page = paginate(
+        _spec_filtered(request, products),
+        cursor=request.GET.get('cursor'),
+        page_size=parse_page_size(request.GET.get('page_size')),
+    )
+    return _render_product_list(request, page, categories, current_category)
+
+
+@cache_anonymous_page(lambda request: [list_tag(request.GET.get('category'))])
+async def aproduct_list(request):
+    """product_list through the async ORM, for ASGI servers (see devloom.urls)."""
+    category_q = request.GET.get('category')
+    categories = [c async for c in Category.objects.all()]
+    products = Product.objects.select_related('category')
+
+    current_category = None
+    if category_q:
+        try:
+            current_category = await _category_named(category_q).aget()
+            products = products.filter(category=current_category)
+        except Category.DoesNotExist:
+            products = products.none()
+
+    page = await apaginate(
+        _spec_filtered(request, products),
+        cursor=request.GET.get('cursor'),
+        page_size=parse_page_size(request.GET.get('page_size')),
+    )
+    return _render_product_list(request, page, categories, current_category)
 
 
 import re
-def product_detail(request, id):
-    product = get_object_or_404(Product, id=id)
-    # Extract RAM and storage from description if not set
-    ram = getattr(product, 'ram', None)
-    storage = getattr(product, 'storage', None)
+def _detail_tags(request, id):
+    # the page shows its neighbours' names, prices and images too
+    return [product_tag(pk) for pk in [id, *bought_together(id)]]
+
+
+async def _adetail_tags(request, id):
+    return [product_tag(pk) for pk in [id, *await abought_together(id)]]
+
+
+def _render_product_detail(request, product, related_ids, related):
     desc = product.description or ''
     # Remove extra blank lines from description
-    import re
     cleaned_desc = re.sub(r'\n{2,}', '\n', desc.strip())
-    # Try to extract RAM (e.g., '16gb ram')
-    if (not ram or ram == 'N/A') and desc:
-        match = re.search(r'(\d{1,3})\s*gb\s*ram', desc.lower())
-        if match:
-            ram = f"{match.group(1)} GB"
-        else:
-            ram = 'N/A'
-    # Try to extract storage (e.g., '256 ssd')
-    if (not storage or storage == 'N/A') and desc:
-        match = re.search(r'(\d{2,4})\s*(gb|tb)?\s*ssd', desc.lower())
-        if match:
-            size = match.group(1)
-            unit = match.group(2) or 'GB'
-            storage = f"{size} {unit.upper()} SSD"
-        else:
-            storage = 'N/A'
+    # RAM and storage are parsed once on save into indexed columns
+    ram = format_ram(product.ram_gb)
+    storage = format_storage(product.storage_gb)
     return render(request, 'devloom/product_detail.html', {
         'product': product,
         'ram': ram,
         'storage': storage,
         'cleaned_desc': cleaned_desc,
+        'bought_together': [related[pk] for pk in related_ids if pk in related],
+    })
+
+
+@cache_anonymous_page(_detail_tags)
+def product_detail(request, id):
+    product = get_object_or_404(Product.objects.select_related('category'), id=id)
+    # neighbours come precomputed from the co-purchase index (one pk read)
+    related_ids = bought_together(product.id)
+    related = Product.objects.in_bulk(related_ids) if related_ids else {}
+    return _render_product_detail(request, product, related_ids, related)
+
+
+@cache_anonymous_page(_adetail_tags)
+async def aproduct_detail(request, id):
+    """product_detail through the async ORM, for ASGI servers (see devloom.urls)."""
+    product = await aget_object_or_404(Product.objects.select_related('category'), id=id)
+    related_ids = await abought_together(product.id)
+    related = await Product.objects.ain_bulk(related_ids) if related_ids else {}
+    return _render_product_detail(request, product, related_ids, related)
+
+
+def search(request):
+    """Full-text product search (see devloom.search).
+
+    GET params: `q`, optional `category` (id), `min_price` / `max_price`
+    (one of the price facets) and `page`.
+    """
+    query = request.GET.get('q', '').strip()
+    filters = {}
+    for param in ('category', 'min_price', 'max_price'):
+        try:
+            filters[param] = int(request.GET[param])
+        except (KeyError, ValueError):
+            filters[param] = None
+    try:
+        page = max(1, min(int(request.GET.get('page', 1)), SEARCH_MAX_PAGES))
+    except ValueError:
+        page = 1
+    page_size = parse_page_size(request.GET.get('page_size'), default=SEARCH_PAGE_SIZE)
+
+    results = product_search(
+        query,
+        category_id=filters['category'],
+        min_price=filters['min_price'],
+        max_price=filters['max_price'],
+        limit=page_size,
+        offset=(page - 1) * page_size,
+    )
+    return render(request, 'devloom/search.html', {
+        'query': query,
+        'results': results,
+        'products': results.products,
+        'current_category': filters['category'],
+        'min_price': filters['min_price'],
+        'page_number': page,
+        'has_previous': page > 1,
+        'has_next': page < SEARCH_MAX_PAGES and page * page_size < results.total,
+        'card_generation': card_generation(),
     })
 
 
 def add_to_cart(request, id):
-    """Simple session-backed cart increment for demonstration.
+    """Add one unit of a product to the visitor's cart (see devloom.cart).
 
-    Increments `request.session['cart_count']` and redirects back to
-    the product detail page.
+    Redirects back to the product detail page.
     """
     product = get_object_or_404(Product, id=id)
-    # maintain a cart_items list in session with simple {id,name,price,image,qty}
-    cart = request.session.get('cart_items', [])
-    # look for existing item
-    found = None
-    for entry in cart:
-        if int(entry.get('id')) == int(id):
-            found = entry
-            break
-    if found:
-        # increment quantity
-        try:
-            found['qty'] = int(found.get('qty', 1)) + 1
-        except Exception:
-            found['qty'] = 1
-    else:
-        # add new item snapshot
-        cart.append({
-            'id': product.id,
-            'name': product.name,
-            'price': str(product.price),
-            'image': product.image or '',
-            'qty': 1,
-        })
-    request.session['cart_items'] = cart
-    # update cart_count as total quantity
-    total_qty = 0
-    for entry in cart:
-        try:
-            total_qty += int(entry.get('qty', 0))
-        except Exception:
-            total_qty += 0
-    request.session['cart_count'] = total_qty
+    request.cart.add(product.id, price=product.price)
     # redirect back to product detail or product list
     return redirect('product_detail', id=id)
 
 
-def cart_view(request):
-    count = request.session.get('cart_count', 0)
-    items = request.session.get('cart_items', [])
-    # compute subtotal (sum of price * qty) where price may be stored as string
-    subtotal = 0.0
-    for it in items:
-        try:
-            price = float(it.get('price', 0) or 0)
-            qty = int(it.get('qty', 1))
-            subtotal += price * qty
-        except Exception:
-            continue
+def _render_cart(request, items, recommendations):
+    subtotal = cart_subtotal(items)
+    # price changes are flagged once, on this render
+    request.cart.accept_prices(items)
     # build a prefilled WhatsApp message listing items
     if items:
         parts = []
@@ -193,29 +271,8 @@ def cart_view(request):
     else:
         wa_link = "https://wa.me/254111670942"
 
-    # --- Recommendations logic ---
-    from random import sample
-    recommendations = []
-    # Try to get up to 3 random laptops or accessories
-    try:
-        laptop_cat = Category.objects.filter(name__icontains='laptop').first()
-        acc_cat = Category.objects.filter(name__icontains='accessor').first()
-        products_qs = Product.objects.none()
-        if laptop_cat:
-            products_qs = products_qs | Product.objects.filter(category=laptop_cat)
-        if acc_cat:
-            products_qs = products_qs | Product.objects.filter(category=acc_cat)
-        # Exclude items already in cart
-        cart_ids = [it.get('id') for it in items]
-        products_qs = products_qs.exclude(id__in=cart_ids)
-        products = list(products_qs)
-        if products:
-            recommendations = sample(products, min(3, len(products)))
-    except Exception:
-        recommendations = []
-
     return render(request, 'devloom/cart.html', {
-        'count': count,
+        'count': request.cart.count,
         'items': items,
         'subtotal': subtotal,
         'wa_link': wa_link,
@@ -223,69 +280,70 @@ def cart_view(request):
     })
 
 
+def cart_view(request):
+    # live prices and stock for every line, one query
+    items = request.cart.items()
+
+    # --- Recommendations logic ---
+    try:
+        recommendations = recommend_for_cart(request.cart.ids(), limit=3)
+    except Exception:
+        recommendations = []
+    return _render_cart(request, items, recommendations)
+
+
+async def acart_view(request):
+    """cart_view through the async ORM, for ASGI servers (see devloom.urls)."""
+    items = await request.cart.aitems()
+    try:
+        recommendations = await arecommend_for_cart(request.cart.ids(), limit=3)
+    except Exception:
+        recommendations = []
+    # flashed messages can fall back to the session: load it through the
+    # async session API, so rendering them reads it from memory
+    await request.session.akeys()
+    return _render_cart(request, items, recommendations)
+
+
 def remove_from_cart(request, id):
     # only allow POST to remove
     if request.method != 'POST':
         return redirect('cart')
-    cart = request.session.get('cart_items', [])
-    new_cart = [it for it in cart if int(it.get('id')) != int(id)]
-    request.session['cart_items'] = new_cart
-    # recompute count
-    total_qty = 0
-    for entry in new_cart:
-        try:
-            total_qty += int(entry.get('qty', 0))
-        except Exception:
-            pass
-    request.session['cart_count'] = total_qty
+    request.cart.remove(id)
     return redirect('cart')
 
 
 def place_order(request):
-    from .models import Order, OrderItem
     if request.method == 'POST':
         # Get customer info from POST or use placeholders
         name = request.POST.get('customer_name', '').strip() or 'Anonymous'
         email = request.POST.get('customer_email', '').strip() or 'noemail@example.com'
-        cart_items = request.session.get('cart_items', [])
+        cart_items = request.cart.items()
         if not cart_items:
             return redirect('cart')
-        # Save order
-        order = Order.objects.create(customer_name=name, customer_email=email)
-        for it in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product_id=it.get('id'),
-                name=it.get('name', ''),
-                price=it.get('price', 0),
-                quantity=it.get('qty', 1),
-            )
-        # Send email notification to admin
-        from django.conf import settings
-        from django.core.mail import send_mail
-        admin_email = getattr(settings, 'ADMIN_EMAIL', None)
-        if admin_email:
-            subject = f"New Order #{order.id} from {order.customer_name}"
-            item_lines = [f"- {oi.quantity} x {oi.name} @ Ksh {oi.price}" for oi in order.items.all()]
-            message = (
-                f"A new order has been placed.\n\n"
-                f"Order ID: {order.id}\n"
-                f"Customer: {order.customer_name} <{order.customer_email}>\n"
-                f"Items:\n" + '\n'.join(item_lines) + "\n\n"
-                f"View in admin: /admin/devloom/order/{order.id}/"
-            )
-            send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [admin_email], fail_silently=True)
+        # never charge a price the customer has not been shown
+        if any(it['price_changed'] for it in cart_items):
+            messages.warning(request, 'Some prices in your cart have changed. Please review your cart before ordering.')
+            return redirect('cart')
+        # Save order, line items and stock decrements atomically
+        try:
+            order, order_items = create_order(name, email, cart_items)
+        except OutOfStock as e:
+            messages.error(request, f'Sorry, {e.name} no longer has enough stock for your order. Please update your cart.')
+            return redirect('cart')
         # Clear cart
-        request.session['cart_items'] = []
-        request.session['cart_count'] = 0
+        request.cart.clear()
         return render(request, 'devloom/order_success.html', {'items': cart_items, 'order': order})
     # If GET, show a simple form for name/email before placing order
-    cart_items = request.session.get('cart_items', [])
+    cart_items = request.cart.items()
     if not cart_items:
         return redirect('cart')
-    return render(request, 'devloom/order_checkout.html', {'items': cart_items})
+    # the checkout page shows live prices, so those are the ones agreed to
+    request.cart.accept_prices(cart_items)
+    return render(request, 'devloom/order_checkout.html', {'items': cart_items, 'subtotal': cart_subtotal(cart_items)})
 
 
 # About page view
+@cache_anonymous_page()
 def about(request):
     return render(request, 'devloom/about.html')